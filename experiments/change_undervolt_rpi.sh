@@ -1,2 +1,2 @@
-sudo cp tryboot_scratch.txt /boot/firmware/tryboot.txt
+sudo python3 /home/baking/easy_bake/ser-automation/tgt_scripts/tryboot_render.py install tryboot_scratch.txt
 sudo reboot '0 tryboot'
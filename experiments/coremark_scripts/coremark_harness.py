@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# CoreMark performance-vs-voltage harness
+#
+# On the pi (from ~/coremark, after booting into the voltage/frequency point):
+#     ./coremark_harness.py run [--stress-ng fft]
+# runs CoreMark (and optionally stress-ng --metrics-brief) while sampling
+# vcgencmd in the background, and writes litmus_<timestamp>/result.json with
+# iterations/sec lined up against the telemetry from the same run, including
+# whether the pi throttled (which would make the number meaningless).
+#
+# On the host, after pull_coremark.sh:
+#     ./coremark_harness.py curves coremark_outputs --out perf_curves.csv
+# gives per-board perf-per-volt curves, relative to each board's stock voltage.
+
+import argparse
+import csv
+import datetime
+import glob
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import threading
+import time
+
+# get_throttled bits (https://www.raspberrypi.com/documentation/computers/os.html#get_throttled)
+THROTTLE_NOW = 0xF        # under-voltage, arm freq capped, throttled, soft temp limit (right now)
+
+COREMARK_RE = re.compile(r"Iterations/Sec\s*:\s*([\d.]+)")
+STRESS_NG_RE = re.compile(r"\]\s+(\S+)\s+(\d+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)\s*$")
+
+
+def vcgencmd(*args):
+    " The value after '=' in vcgencmd's output, or None "
+    try:
+        out = subprocess.run(["vcgencmd", *args], capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return out.strip().split("=", 1)[-1] if "=" in out else None
+
+
+def parseNum(s):
+    m = re.match(r"\s*(0x[0-9a-fA-F]+|-?[\d.]+)", s or "")
+    if not m:
+        return None
+    return int(m.group(1), 16) if m.group(1).startswith("0x") else float(m.group(1))
+
+
+class Sampler:
+    " Samples arm clock / core volts / temp / throttle flags in a background thread "
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.samples.append({
+                "time": time.time(),
+                "arm_mhz": (parseNum(vcgencmd("measure_clock", "arm")) or 0) / 1e6 or None,
+                "volt_v": parseNum(vcgencmd("measure_volts", "core")),
+                "temp_c": parseNum(vcgencmd("measure_temp")),
+                "throttled": parseNum(vcgencmd("get_throttled")),
+            })
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def between(self, start, end):
+        return [s for s in self.samples if start <= s["time"] <= end]
+
+
+def summarize(samples, frequency=None):
+    " Telemetry during a run, plus whether it throttled "
+    def vals(key):
+        return [s[key] for s in samples if s[key] is not None]
+
+    arm, volt, temp, thr = vals("arm_mhz"), vals("volt_v"), vals("temp_c"), vals("throttled")
+    flags = 0
+    for t in thr:
+        flags |= int(t)
+    throttled = bool(flags & THROTTLE_NOW)
+    # Also count it if the clock sagged below what we asked for
+    if frequency and arm and statistics.median(arm) < 0.98 * frequency:
+        throttled = True
+
+    return {
+        "samples": len(samples),
+        "arm_mhz_mean": statistics.mean(arm) if arm else None,
+        "arm_mhz_min": min(arm) if arm else None,
+        "volt_v_mean": statistics.mean(volt) if volt else None,
+        "temp_c_max": max(temp) if temp else None,
+        "throttled_flags": hex(flags),
+        "throttled": throttled,
+    }
+
+
+def runCoremark(coremark_dir, iterations):
+    """ Runs CoreMark's make, returns (iters/sec per run, valid, start, end)
+    make leaves its results in run1.log (performance) and run2.log (validation) """
+    start = time.time()
+    proc = subprocess.run(["make", f"ITERATIONS={iterations}"], cwd=coremark_dir,
+                          capture_output=True, text=True)
+    end = time.time()
+
+    rates = []
+    valid = proc.returncode == 0
+    for log in ("run1.log", "run2.log"):
+        try:
+            with open(os.path.join(coremark_dir, log)) as f:
+                text = f.read()
+        except FileNotFoundError:
+            valid = False
+            continue
+        rates += [float(m) for m in COREMARK_RE.findall(text)]
+        if "Errors detected" in text or "Cannot validate" in text:
+            valid = False
+    return rates, valid, start, end
+
+
+def runStressNg(method, duration):
+    " stress-ng --metrics-brief, returns ({stressor: bogo ops/s (real time)}, ok, start, end) "
+    start = time.time()
+    proc = subprocess.run(["stress-ng", "--cpu", "4", "--cpu-method", method, "--verify",
+                           "-t", f"{duration}s", "--metrics-brief"],
+                          capture_output=True, text=True)
+    end = time.time()
+    metrics = {}
+    for line in (proc.stdout + proc.stderr).splitlines():
+        m = STRESS_NG_RE.search(line)
+        if m:
+            metrics[m.group(1)] = float(m.group(6))
+    ok = proc.returncode == 0 and "fail:" not in proc.stderr
+    return metrics, ok, start, end
+
+
+def cmdRun(args):
+    outdir = args.out or datetime.datetime.now().strftime("litmus_%Y%m%d_%H%M%S")
+    os.makedirs(outdir, exist_ok=True)
+    # Default to whatever this boot's config.txt/tryboot.txt asked for
+    if args.voltage is None:
+        args.voltage = int(parseNum(vcgencmd("get_config", "over_voltage")) or 0)
+    if args.frequency is None:
+        args.frequency = int(parseNum(vcgencmd("get_config", "arm_freq")) or 0) or None
+    result = {"board": socket.gethostname(), "voltage": args.voltage,
+              "frequency": args.frequency, "iterations": args.iterations}
+
+    with Sampler(args.interval) as sampler:
+        time.sleep(args.settle)
+        rates, valid, start, end = runCoremark(args.coremark_dir, args.iterations)
+        result["coremark"] = {
+            "iters_per_sec": rates, "valid": valid,
+            "iters_per_sec_mean": statistics.mean(rates) if rates else None,
+            "seconds": end - start,
+            "telemetry": summarize(sampler.between(start, end), args.frequency),
+        }
+
+        if args.stress_ng:
+            metrics, ok, start, end = runStressNg(args.stress_ng, args.stress_time)
+            result["stress_ng"] = {
+                "method": args.stress_ng, "bogo_ops_per_sec": metrics, "ok": ok,
+                "telemetry": summarize(sampler.between(start, end), args.frequency),
+            }
+
+    with open(os.path.join(outdir, "pi_stats.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["time", "arm_mhz", "volt_v", "temp_c", "throttled"])
+        writer.writeheader()
+        writer.writerows(sampler.samples)
+    for log in ("run1.log", "run2.log"):
+        if os.path.exists(os.path.join(args.coremark_dir, log)):
+            os.replace(os.path.join(args.coremark_dir, log), os.path.join(outdir, log))
+    with open(os.path.join(outdir, "result.json"), "w") as f:
+        json.dump(result, f, indent=2)
+
+    cm = result["coremark"]
+    print(f"{result['board']} V={args.voltage} F={args.frequency}: "
+          f"{cm['iters_per_sec_mean']} iters/s, valid={cm['valid']}, "
+          f"throttled={cm['telemetry']['throttled']} -> {outdir}")
+
+
+def loadResults(root):
+    " All result.json under root (coremark_outputs/<host>/litmus_*/result.json) "
+    results = []
+    for path in sorted(glob.glob(os.path.join(root, "**", "result.json"), recursive=True)):
+        with open(path) as f:
+            results.append(json.load(f))
+    return results
+
+
+def perfCurves(results):
+    """ One row per (board, voltage, frequency), averaged over repeats, with
+    iters/s per volt and perf relative to the board's stock (voltage 0) point """
+    points = {}
+    for r in results:
+        cm = r.get("coremark", {})
+        if cm.get("iters_per_sec_mean") is None:
+            continue
+        key = (r["board"], r["voltage"], r["frequency"])
+        points.setdefault(key, []).append(r)
+
+    rows = []
+    for (board, voltage, frequency), rs in sorted(points.items(), key=lambda kv: (kv[0][0], kv[0][2] or 0, kv[0][1])):
+        rate = statistics.mean(r["coremark"]["iters_per_sec_mean"] for r in rs)
+        volts = [r["coremark"]["telemetry"]["volt_v_mean"] for r in rs
+                 if r["coremark"]["telemetry"]["volt_v_mean"]]
+        volt = statistics.mean(volts) if volts else None
+        bogo = [sum(r["stress_ng"]["bogo_ops_per_sec"].values()) for r in rs
+                if r.get("stress_ng", {}).get("bogo_ops_per_sec")]
+        rows.append({
+            "board": board, "voltage": voltage, "frequency": frequency, "runs": len(rs),
+            "volt_v": volt, "iters_per_sec": rate,
+            "iters_per_sec_per_volt": rate / volt if volt else None,
+            "bogo_ops_per_sec": statistics.mean(bogo) if bogo else None,
+            "throttled": any(r["coremark"]["telemetry"]["throttled"] for r in rs),
+            "valid": all(r["coremark"]["valid"] for r in rs),
+        })
+
+    # Relative to stock voltage at the same frequency
+    stock = {(r["board"], r["frequency"]): r["iters_per_sec"] for r in rows if r["voltage"] == 0}
+    for r in rows:
+        base = stock.get((r["board"], r["frequency"]))
+        r["rel_perf"] = r["iters_per_sec"] / base if base else None
+    return rows
+
+
+def cmdCurves(args):
+    rows = perfCurves(loadResults(args.root))
+    if not rows:
+        print(f"No results under {args.root}")
+        return
+
+    print(f"{'board':>14} {'uvolt':>6} {'MHz':>6} {'volt':>7} {'iters/s':>10} {'/volt':>10} {'rel':>6}  flags")
+    for r in rows:
+        def fmt(val, spec):
+            return format(val, spec) if val is not None else "?"
+        flags = ("THROTTLED " if r["throttled"] else "") + ("" if r["valid"] else "INVALID")
+        print(f"{r['board']:>14} {fmt(r['voltage'], '6')} {fmt(r['frequency'], '6')}"
+              f" {fmt(r['volt_v'], '7.4f')} {fmt(r['iters_per_sec'], '10.1f')}"
+              f" {fmt(r['iters_per_sec_per_volt'], '10.1f')} {fmt(r['rel_perf'], '6.3f')}  {flags}")
+
+    if args.out:
+        with open(args.out, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Wrote {args.out}")
+
+
+# ==================== MAIN
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="coremark_harness.py",
+                description="CoreMark (and stress-ng) throughput vs voltage, lined up with telemetry")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_run = sub.add_parser("run", help="(on the pi) benchmark the current voltage/frequency point")
+    p_run.add_argument("--voltage", type=int, help="over_voltage this boot was set to (default: ask vcgencmd)")
+    p_run.add_argument("--frequency", type=int, help="arm_freq (MHz) this boot was set to (default: ask vcgencmd)")
+    p_run.add_argument("--iterations", type=int, default=100000)
+    p_run.add_argument("--coremark-dir", default=".")
+    p_run.add_argument("--stress-ng", metavar="METHOD", help="also run stress-ng --cpu-method METHOD")
+    p_run.add_argument("--stress-time", type=int, default=30, help="seconds of stress-ng")
+    p_run.add_argument("--interval", type=float, default=0.1, help="seconds between telemetry samples")
+    p_run.add_argument("--settle", type=float, default=60, help="seconds to sample before starting")
+    p_run.add_argument("--out", help="output directory (default litmus_<timestamp>)")
+
+    p_curves = sub.add_parser("curves", help="(on the host) per-board perf-per-volt curves")
+    p_curves.add_argument("root", nargs="?", default="coremark_outputs")
+    p_curves.add_argument("--out", help="write the curves to this CSV")
+
+    args = parser.parse_args()
+    cmdRun(args) if args.cmd == "run" else cmdCurves(args)
@@ -1,13 +1,5 @@
 #/bin/bash
 
-TIMESTAMP=$(date +%Y%m%d_%H%M%S)
-mkdir litmus_$TIMESTAMP
-./run_voltage.sh &
-(
-sleep 60
-./run_coremark.sh
-)
-wait
-mv run1.log litmus_$TIMESTAMP
-mv run2.log litmus_$TIMESTAMP
-mv pi_stats.csv litmus_$TIMESTAMP
+# Extra args go to the harness, e.g. ./run_litmus.sh --stress-ng fft
+# (results end up in litmus_<timestamp>/, same as before, plus result.json)
+python3 ./coremark_harness.py run "$@"
@@ -4,6 +4,11 @@ HOSTS_FILE="pssh_hosts.txt"
 USER="baking"
 # The folder where dumps will be stored on each Pi
 CORE_DIR="/home/baking/dumps"
+# Dumps get piped through this, which compresses them and only keeps one per
+# unique crash (see testing/dumps/dump_store.py). It stores to $CORE_DIR by
+# default: core_pattern is capped at 128 chars, so no room for --store
+DUMP_STORE="/home/baking/easy_bake/testing/dumps/dump_store.py"
+CORE_PATTERN="|$DUMP_STORE ingest --exe %e --time %t --signal %s"
 
 echo "--- Enabling Core Dumps across the fleet ---"
 
@@ -19,11 +24,14 @@ while IFS= read -r host || [ -n "$host" ]; do
         mkdir -p $CORE_DIR && chmod 777 $CORE_DIR
         
         # 2. Set the core pattern (Kernel level)
-        # %e = executable name, %p = pid, %t = timestamp
-        echo '$CORE_DIR/core.%e.%p.%t' | sudo tee /proc/sys/kernel/core_pattern
+        # %e = executable name, %t = timestamp, %s = signal
+        echo '$CORE_PATTERN' | sudo tee /proc/sys/kernel/core_pattern
         
         # 3. Make the pattern persistent across reboots
-        echo 'kernel.core_pattern=$CORE_DIR/core.%e.%p.%t' | sudo tee /etc/sysctl.d/99-core-dumps.conf
+        echo 'kernel.core_pattern=$CORE_PATTERN' | sudo tee /etc/sysctl.d/99-core-dumps.conf
+
+        # 3b. Fold in any raw dumps left over from the old core.%e.%p.%t pattern
+        ls $CORE_DIR/core.* >/dev/null 2>&1 && sudo $DUMP_STORE --store $CORE_DIR ingest --delete $CORE_DIR/core.*
         
         # 4. Set the ulimit to 'unlimited' for the current user in bash
         if ! grep -q 'ulimit -c unlimited' ~/.bashrc; then
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# Push-based fleet telemetry collector
+#
+# Each pi's heartbeat (testing/heartbeat/heartbeat.sh) pushes a one-line
+# sample every 10s, so we don't have to ssh into every board (while it's under
+# stress) to find out how it's doing:
+#     EB1,<hostname>,<epoch>,temp=48.3'C,volt=0.8563V,frequency(1)=500000000,frequency(48)=1500000000
+#
+# This collects them (UDP, or TCP for networks that eat UDP), keeps the latest
+# sample per board in memory, appends samples to a CSV in batches, and answers
+# fleet status queries straight from memory.
+#
+#     ./fleet_collector.py serve                # on the host
+#     ./fleet_collector.py status               # fleet snapshot, instantly
+#     ./fleet_collector.py status --json
+#
+# To point a pi at the collector, put "<collector host> <push port>" in
+# /home/baking/eb_collector.conf
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import re
+import socket
+import time
+
+PUSH_PORT = 5140   # UDP and TCP
+QUERY_PORT = 5141  # TCP, send STATUS, get JSON back
+CSV_PATH = "fleet_telemetry.csv"
+FLUSH_INTERVAL = 30 # seconds between CSV writes
+STALE_AFTER = 60    # seconds without a sample before we call a board offline
+
+CSV_COLUMNS = ["recv_time", "hostname", "sample_time", "temp_c", "volt_v", "freq_core_hz", "freq_arm_hz"]
+
+
+def parseNum(pattern, field):
+    m = re.search(pattern, field)
+    return float(m.group(1)) if m else None
+
+
+def parseSample(line):
+    """ Parses a heartbeat line into a dict, or None if it's not one
+    Values are raw vcgencmd output, e.g. temp=48.3'C, volt=0.8563V """
+    fields = line.strip().split(",")
+    if len(fields) != 7 or fields[0] != "EB1":
+        return None
+    _, hostname, epoch, temp, volt, freq_core, freq_arm = fields
+    try:
+        sample_time = float(epoch)
+    except ValueError:
+        return None
+    return {
+        "hostname": hostname,
+        "sample_time": sample_time,
+        "temp_c": parseNum(r"temp=([\d.]+)", temp),
+        "volt_v": parseNum(r"volt=([\d.]+)", volt),
+        "freq_core_hz": parseNum(r"=(\d+)", freq_core),
+        "freq_arm_hz": parseNum(r"=(\d+)", freq_arm),
+    }
+
+
+class FleetState:
+    " Latest sample per board, plus the samples that haven't been written out yet "
+
+    def __init__(self, csv_path=CSV_PATH):
+        self.csv_path = csv_path
+        self.boards = {}   # hostname -> latest sample (+ last_seen, samples)
+        self.pending = []  # rows waiting for the next flush
+        self.bad = 0
+
+    def ingest(self, line, now=None):
+        sample = parseSample(line)
+        if sample is None:
+            self.bad += 1
+            return False
+        now = now or time.time()
+        board = self.boards.setdefault(sample["hostname"], {"samples": 0})
+        board.update(sample)
+        board["last_seen"] = now
+        board["samples"] += 1
+        self.pending.append(dict(sample, recv_time=now))
+        return True
+
+    def snapshot(self, now=None):
+        now = now or time.time()
+        boards = {}
+        for hostname, board in sorted(self.boards.items()):
+            age = now - board["last_seen"]
+            boards[hostname] = dict(board, age=round(age, 1), online=age < STALE_AFTER)
+        return {"time": now, "boards": boards, "bad_samples": self.bad}
+
+    def flush(self):
+        " Appends pending samples to the CSV in one go "
+        if not self.pending:
+            return 0
+        rows, self.pending = self.pending, []
+        new_file = not os.path.exists(self.csv_path)
+        with open(self.csv_path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+        return len(rows)
+
+
+class PushProtocol(asyncio.DatagramProtocol):
+    def __init__(self, state):
+        self.state = state
+
+    def datagram_received(self, data, addr):
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            self.state.ingest(line)
+
+
+async def handlePush(state, reader, writer):
+    " TCP pushes: one sample per line, for as long as the pi keeps the connection "
+    try:
+        while line := await reader.readline():
+            state.ingest(line.decode("utf-8", errors="replace"))
+    finally:
+        writer.close()
+
+
+async def handleQuery(state, reader, writer):
+    try:
+        cmd = (await reader.readline()).decode("utf-8", errors="replace").strip().upper()
+        if cmd in ("", "STATUS"):
+            reply = state.snapshot()
+        else:
+            reply = {"error": f"unknown command '{cmd}'"}
+        writer.write((json.dumps(reply) + "\n").encode())
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def flushLoop(state, interval):
+    while True:
+        await asyncio.sleep(interval)
+        state.flush()
+
+
+async def serve(state, bind, push_port, query_port, flush_interval):
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: PushProtocol(state), local_addr=(bind, push_port))
+    push_server = await asyncio.start_server(
+        lambda r, w: handlePush(state, r, w), bind, push_port)
+    query_server = await asyncio.start_server(
+        lambda r, w: handleQuery(state, r, w), bind, query_port)
+    print(f"Collecting on {bind}:{push_port} (udp+tcp), queries on {bind}:{query_port}")
+
+    try:
+        async with push_server, query_server:
+            await flushLoop(state, flush_interval)
+    finally:
+        transport.close()
+        state.flush()
+
+
+def query(host, port, timeout=5):
+    " Asks a running collector for the fleet snapshot "
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(b"STATUS\n")
+        data = b""
+        while chunk := sock.recv(65536):
+            data += chunk
+    return json.loads(data)
+
+
+def formatStatus(status):
+    lines = [f"{'hostname':>16} {'temp':>6} {'volt':>7} {'arm MHz':>8} {'seen':>8}"]
+    for hostname, b in status["boards"].items():
+        def fmt(val, spec):
+            return format(val, spec) if val is not None else "?"
+        seen = f"{b['age']:.0f}s ago" if b["online"] else "OFFLINE"
+        arm = b["freq_arm_hz"] / 1e6 if b["freq_arm_hz"] else None
+        lines.append(f"{hostname:>16} {fmt(b['temp_c'], '6.1f')} {fmt(b['volt_v'], '7.4f')}"
+                     f" {fmt(arm, '8.0f')} {seen:>8}")
+    return "\n".join(lines)
+
+
+# ==================== MAIN
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="fleet_collector.py",
+                description="Collects heartbeat telemetry pushed by the pis, and answers fleet status queries")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_serve = sub.add_parser("serve", help="run the collector")
+    p_serve.add_argument("--bind", default="0.0.0.0")
+    p_serve.add_argument("--push-port", type=int, default=PUSH_PORT)
+    p_serve.add_argument("--query-port", type=int, default=QUERY_PORT)
+    p_serve.add_argument("--csv", default=CSV_PATH, help="where to append samples")
+    p_serve.add_argument("--flush", type=float, default=FLUSH_INTERVAL, help="seconds between CSV writes")
+
+    p_status = sub.add_parser("status", help="print the fleet status from a running collector")
+    p_status.add_argument("--host", default="localhost")
+    p_status.add_argument("--query-port", type=int, default=QUERY_PORT)
+    p_status.add_argument("--json", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.cmd == "serve":
+        try:
+            asyncio.run(serve(FleetState(args.csv), args.bind, args.push_port,
+                              args.query_port, args.flush))
+        except KeyboardInterrupt:
+            pass
+    else:
+        status = query(args.host, args.query_port)
+        print(json.dumps(status, indent=2) if args.json else formatStatus(status))
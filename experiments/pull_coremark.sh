@@ -6,3 +6,5 @@ for h in $(cat hostnames.txt); do
      mkdir -p coremark_outputs/$h
      scp -r baking@$h.dynamic.ucsd.edu:/home/baking/coremark/litmus* coremark_outputs/$h
  done
+
+python3 coremark_scripts/coremark_harness.py curves coremark_outputs --out coremark_outputs/perf_curves.csv
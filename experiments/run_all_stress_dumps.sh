@@ -30,6 +30,8 @@ while IFS= read -r host || [ -n "$host" ]; do
     # We wrap the command in a subshell that sets the environment locally
     # 1. suid_dumpable=1: Allows sudo processes to dump core
     # 2. ulimit -c unlimited: Removes the size cap for the dump
+    # Dumps go into the dump store (enable_core_dump.sh), see what crashed with
+    #     python3 /home/baking/easy_bake/testing/dumps/dump_store.py list
     CMD="sudo sh -c 'echo 1 > /proc/sys/fs/suid_dumpable; ulimit -c unlimited; /home/baking/easy_bake/testing/probe/run_stress_man.sh fft 20' > $LOG_FILE 2>&1"
 
     # Launch in tmux
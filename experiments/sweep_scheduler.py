@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# Work-queue sweep scheduler
+#
+# Instead of pushing the same over_voltage to every board and waiting for the
+# slowest one (change_undervolt_all.sh), keep a queue of sweep points and hand
+# each board its next point as soon as it reports back:
+# - points come from a gen_config sweep space (--config test_sweep) or the
+#   eb_probe undervolt ladder (--probe-steps 12)
+# - each point wants --runs results in total, preferably from different boards
+# - a board gets the queued point closest to its own edge (between the most
+#   aggressive level it passed and the least aggressive it failed), with a
+#   separate edge per frequency (a voltage that holds at 1500MHz can fail at 2000)
+# - a board that doesn't report back within --lease seconds is marked offline,
+#   and its point goes back in the queue for someone else
+#
+# Boards talk to it with one JSON line per request:
+#     {"board": "pi1", "result": {"item": 7, "passed": true}}
+#  -> {"item": {"id": 8, "config_id": "test_sweep", "n": 3, "vars": {...}}}
+# ("passed": null means the run didn't tell us anything, e.g. it never booted:
+# the item just goes back in the queue)
+#
+#     ./sweep_scheduler.py serve --config test_sweep --runs 3
+#     ./sweep_scheduler.py next --board pi1 [--item 7 --passed 1]
+#     ./sweep_scheduler.py status
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "ser-automation", "tgt_scripts"))
+
+SCHED_PORT = 5150
+LEASE_TIME = 1800   # seconds a board gets to report back before we give its point away
+STATE_PATH = "sweep_state.jsonl"
+
+
+def configPoints(conf_id):
+    """ Points for every run of a gen_config config; lower VOLTAGE is more aggressive.
+    Each FREQUENCY gets its own edge (group) """
+    import gen_config
+    points = []
+    for n, currVars in enumerate(gen_config.sweepSpace(conf_id)):
+        points.append({"config_id": conf_id, "n": n, "vars": currVars,
+                       "level": -currVars.get("VOLTAGE", 0),
+                       "group": currVars.get("FREQUENCY")})
+    return points
+
+
+def probePoints(steps):
+    " Points for the eb_probe undervolt ladder; higher steps are more aggressive "
+    return [{"config_id": "eb_probe", "n": s, "vars": {"STEP": s}, "level": s, "group": None}
+            for s in range(steps)]
+
+
+class Board:
+    def __init__(self, name):
+        self.name = name
+        self.passed = {}     # group -> levels this board passed
+        self.failed = {}     # group -> levels this board failed
+        self.lease = None    # item id it's working on
+        self.lastSeen = time.time()
+        self.online = True
+        self.busyTime = 0    # seconds spent holding a lease (for utilization)
+        self.leaseStart = None
+
+    def edge(self, group, default):
+        " Best guess for where this board starts failing, in group "
+        passed, failed = self.passed.get(group), self.failed.get(group)
+        if passed and failed:
+            return (max(passed) + min(failed)) / 2
+        if passed:
+            return max(passed) + 1
+        if failed:
+            return min(failed) - 1
+        return default
+
+    def edges(self):
+        " {group: edge} for every group it has results in "
+        return {g: self.edge(g, None) for g in set(self.passed) | set(self.failed)}
+
+
+class Scheduler:
+    def __init__(self, points, runs=1, lease=LEASE_TIME, state_path=None):
+        self.items = {}  # id -> {point..., needed, done, boards}
+        for i, p in enumerate(points):
+            self.items[i] = dict(p, id=i, needed=runs, done=0, active=0, boards=[])
+        self.boards = {}
+        self.leaseTime = lease
+        self.leases = {} # item id -> [(board, deadline)]
+        self.start = time.time()
+        self.state_path = state_path
+        if state_path and os.path.exists(state_path):
+            self.replay(state_path)
+
+    # ============= state
+
+    def replay(self, path):
+        """ Re-applies results from a previous session, so a restart doesn't redo work.
+        Results are matched by (config_id, n): ones for points we aren't sweeping
+        (a different --config, or an old log without them) are skipped """
+        byPoint = {(it["config_id"], it["n"]): it["id"] for it in self.items.values()}
+        skipped = 0
+        with open(path) as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                item_id = byPoint.get((rec.get("config_id"), rec.get("n")))
+                if item_id is None:
+                    skipped += 1
+                    continue
+                self.recordResult(self.board(rec["board"]), item_id, rec["passed"], save=False)
+        if skipped:
+            print(f"Skipped {skipped} results in {path} that aren't for this sweep")
+
+    def board(self, name):
+        if name not in self.boards:
+            self.boards[name] = Board(name)
+        return self.boards[name]
+
+    def fleetEdge(self, group):
+        " Where new boards start looking in group: the median of the other boards' edges, or mid-range "
+        levels = [it["level"] for it in self.items.values() if it["group"] == group]
+        mid = (min(levels) + max(levels)) / 2 if levels else 0
+        edges = [b.edge(group, None) for b in self.boards.values()]
+        edges = [e for e in edges if e is not None]
+        return statistics.median(edges) if edges else mid
+
+    # ============= handing out work
+
+    def recordResult(self, board, item_id, passed, save=True):
+        item = self.items.get(item_id)
+        if item is None:
+            return
+        (board.passed if passed else board.failed).setdefault(item["group"], []).append(item["level"])
+        item["done"] += 1
+        item["boards"].append(board.name)
+
+        self.release(board, item_id)
+
+        if save and self.state_path:
+            with open(self.state_path, "a") as f:
+                f.write(json.dumps({"board": board.name, "item": item_id,
+                                    "config_id": item["config_id"], "n": item["n"],
+                                    "passed": passed, "time": time.time()}) + "\n")
+
+    def release(self, board, item_id):
+        " Gives up board's lease on item_id without a result "
+        leases = self.leases.get(item_id, [])
+        if any(b == board.name for b, _ in leases):
+            self.leases[item_id] = [(b, d) for b, d in leases if b != board.name]
+            self.items[item_id]["active"] -= 1
+
+    def pick(self, board):
+        " The queued item with the highest priority for this board, or None "
+        edges = {}
+        best, best_key = None, None
+        for item in self.items.values():
+            if item["done"] + item["active"] >= item["needed"]:
+                continue
+            group = item["group"]
+            if group not in edges:
+                edges[group] = board.edge(group, self.fleetEdge(group))
+            # Prefer points this board hasn't done, then points near its edge
+            key = (board.name in item["boards"], abs(item["level"] - edges[group]), item["id"])
+            if best_key is None or key < best_key:
+                best, best_key = item, key
+        return best
+
+    def next(self, name, result=None, now=None):
+        " A board reported in: record its result (if any), and give it its next item "
+        now = now or time.time()
+        board = self.board(name)
+        board.lastSeen = now
+        board.online = True
+
+        if board.leaseStart is not None:
+            board.busyTime += now - board.leaseStart
+            board.leaseStart = None
+        # Checked in without reporting the item it had (restarted, lost its
+        # sched.item): it's not working on that any more, let someone else have it
+        reported = result.get("item") if result is not None else None
+        if board.lease is not None and board.lease != reported:
+            self.release(board, board.lease)
+        if result is not None and result.get("passed") is not None:
+            self.recordResult(board, result["item"], bool(result["passed"]))
+        elif result is not None:
+            self.release(board, result["item"])
+        board.lease = None
+
+        item = self.pick(board)
+        if item is None:
+            return None
+        item["active"] += 1
+        self.leases.setdefault(item["id"], []).append((name, now + self.leaseTime))
+        board.lease = item["id"]
+        board.leaseStart = now
+        return {k: item[k] for k in ("id", "config_id", "n", "vars")}
+
+    def reap(self, now=None):
+        " Boards that blew their lease are offline: put their items back in the queue "
+        now = now or time.time()
+        reaped = []
+        for item_id, leases in self.leases.items():
+            for name, deadline in list(leases):
+                if deadline < now:
+                    leases.remove((name, deadline))
+                    self.items[item_id]["active"] -= 1
+                    board = self.boards[name]
+                    board.online = False
+                    # The lease it blew might not be the one it's working on now
+                    if board.lease == item_id:
+                        board.lease = None
+                        board.leaseStart = None
+                    reaped.append((name, item_id))
+        return reaped
+
+    def status(self, now=None):
+        now = now or time.time()
+        elapsed = max(now - self.start, 1)
+        remaining = sum(max(it["needed"] - it["done"], 0) for it in self.items.values())
+        boards = {}
+        for name, b in sorted(self.boards.items()):
+            busy = b.busyTime + (now - b.leaseStart if b.leaseStart else 0)
+            boards[name] = {"online": b.online, "lease": b.lease,
+                            "edges": {str(g): e for g, e in b.edges().items()},
+                            "passed": sum(map(len, b.passed.values())),
+                            "failed": sum(map(len, b.failed.values())),
+                            "utilization": round(busy / elapsed, 3)}
+        return {"items": len(self.items), "remaining": remaining, "boards": boards}
+
+
+# ============= server / client
+
+async def handle(sched, reader, writer):
+    try:
+        while line := await reader.readline():
+            try:
+                req = json.loads(line)
+                if req.get("cmd") == "status":
+                    reply = sched.status()
+                else:
+                    reply = {"item": sched.next(req["board"], req.get("result"))}
+            except (ValueError, KeyError, TypeError) as e:
+                reply = {"error": f"bad request: {e}"}
+            writer.write((json.dumps(reply) + "\n").encode())
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def reapLoop(sched, interval=10):
+    while True:
+        await asyncio.sleep(interval)
+        for name, item_id in sched.reap():
+            print(f"{name} missed its lease on item {item_id}: marked offline, item requeued")
+
+
+async def serve(sched, bind, port):
+    server = await asyncio.start_server(lambda r, w: handle(sched, r, w), bind, port)
+    print(f"Scheduling {len(sched.items)} items on {bind}:{port}")
+    async with server:
+        await reapLoop(sched)
+
+
+def request(host, port, req, timeout=10):
+    " Sends one request to a running scheduler, returns the reply "
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall((json.dumps(req) + "\n").encode())
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    return json.loads(data)
+
+
+def nextItem(host, port, board, item_id=None, passed=None):
+    " Client side: report how item_id went (if any), get the next item (None when done) "
+    req = {"board": board}
+    if item_id is not None:
+        req["result"] = {"item": item_id, "passed": None if passed is None else bool(passed)}
+    return request(host, port, req).get("item")
+
+
+# ==================== MAIN
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="sweep_scheduler.py",
+                description="Hands out sweep points to boards as they report in")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=SCHED_PORT)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_serve = sub.add_parser("serve", help="run the scheduler")
+    p_serve.add_argument("--bind", default="0.0.0.0")
+    space = p_serve.add_mutually_exclusive_group(required=True)
+    space.add_argument("--config", help="gen_config config id to sweep")
+    space.add_argument("--probe-steps", type=int, help="sweep eb_probe undervolt steps 0..N-1")
+    p_serve.add_argument("--runs", type=int, default=1, help="results wanted per point")
+    p_serve.add_argument("--lease", type=float, default=LEASE_TIME, help="seconds before a silent board is offline")
+    p_serve.add_argument("--state", default=STATE_PATH, help="results log, replayed on restart")
+
+    p_next = sub.add_parser("next", help="report a result and/or get the next item")
+    p_next.add_argument("--board", required=True)
+    p_next.add_argument("--item", type=int, help="item we just finished")
+    p_next.add_argument("--passed", type=int, choices=[0, 1])
+
+    sub.add_parser("status", help="print queue and board status")
+
+    args = parser.parse_args()
+
+    if args.cmd == "serve":
+        points = configPoints(args.config) if args.config else probePoints(args.probe_steps)
+        sched = Scheduler(points, args.runs, args.lease, args.state)
+        try:
+            asyncio.run(serve(sched, args.bind, args.port))
+        except KeyboardInterrupt:
+            pass
+    elif args.cmd == "next":
+        print(json.dumps(nextItem(args.host, args.port, args.board, args.item, args.passed)))
+    else:
+        print(json.dumps(request(args.host, args.port, {"cmd": "status"}), indent=2))
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+# Lightweight span tracing, to find out where the hours in a sweep go
+#
+# Wrap a phase in a span:
+#     with tracer.span("scr_AwaitBoot") as sp:
+#         ...
+#         sp.args["bytes"] = 1234
+#
+# Each run's spans get written as a Chrome / Perfetto trace (open it in
+# ui.perfetto.dev or chrome://tracing), and this script aggregates
+# per-phase stats over any number of those traces:
+#     python3 bake_trace.py output_logs/*.trace.json
+
+import contextlib
+import json
+import statistics
+import sys
+import time
+
+
+class Span:
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = dict(args)
+        self.start = time.time()
+        self.end = None
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+
+class Tracer:
+    def __init__(self):
+        self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, name, cat="phase", **args):
+        sp = Span(name, cat, args)
+        try:
+            yield sp
+        finally:
+            sp.end = time.time()
+            self.spans.append(sp)
+
+    def chromeTrace(self, label=""):
+        " The spans as Chrome trace-event JSON (complete 'X' events, in microseconds) "
+        events = [{"name": "process_name", "ph": "M", "pid": 1, "tid": 1,
+                   "args": {"name": label or "bake run"}}]
+        for sp in sorted(self.spans, key=lambda s: s.start):
+            events.append({
+                "name": sp.name, "cat": sp.cat, "ph": "X", "pid": 1, "tid": 1,
+                "ts": int(sp.start * 1e6), "dur": int(sp.duration * 1e6),
+                "args": sp.args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def writeChrome(self, path, label=""):
+        with open(path, "w") as f:
+            json.dump(self.chromeTrace(label), f)
+
+
+def loadSpans(path):
+    " Reads a trace written by Tracer.writeChrome back into (name, cat, seconds, args) tuples "
+    with open(path) as f:
+        trace = json.load(f)
+    return [(ev["name"], ev.get("cat", ""), ev["dur"] / 1e6, ev.get("args", {}))
+            for ev in trace["traceEvents"] if ev.get("ph") == "X"]
+
+
+def phaseStats(spans):
+    """ Aggregates (name, cat, seconds, args) tuples:
+    returns {name: {count, total, mean, p50, max}}, plus a breakdown of the
+    serial reads by how they ended, and how long was spent waiting on silence """
+    durations = {}
+    for name, cat, dur, args in spans:
+        durations.setdefault(name, []).append(dur)
+        if cat == "read":
+            durations.setdefault(f"read[{args.get('end', '?')}]", []).append(dur)
+            durations.setdefault("read silence-waiting", []).append(args.get("silence_wait", 0))
+
+    stats = {}
+    for name, durs in durations.items():
+        stats[name] = {
+            "count": len(durs), "total": sum(durs), "mean": statistics.mean(durs),
+            "p50": statistics.median(durs), "max": max(durs),
+        }
+    return stats
+
+
+def formatStats(stats):
+    lines = [f"{'phase':>28} {'count':>6} {'total':>9} {'mean':>8} {'p50':>8} {'max':>8}"]
+    for name, st in sorted(stats.items(), key=lambda kv: -kv[1]["total"]):
+        lines.append(f"{name:>28} {st['count']:6} {st['total']:8.1f}s {st['mean']:7.1f}s"
+                     f" {st['p50']:7.1f}s {st['max']:7.1f}s")
+    return "\n".join(lines)
+
+
+# ==================== MAIN
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: bake_trace.py TRACE.json [TRACE.json ...]")
+        raise SystemExit(1)
+
+    spans = []
+    for path in sys.argv[1:]:
+        spans += loadSpans(path)
+    print(f"{len(sys.argv) - 1} traces, {len(spans)} spans")
+    print(formatStats(phaseStats(spans)))
@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+# Adaptive boot watchdog
+#
+# Instead of always waiting the full boot timeout, learn from old run logs
+# (output_logs/*.log) how long each step of boot normally takes, and call it a
+# hang as soon as the next milestone is overdue. Hangs are exactly what
+# undervolting produces, so this saves most of the 2+ minutes per failed boot.
+#
+# To see what it learned:
+#     python3 boot_watchdog.py output_logs
+
+import datetime
+import glob
+import os
+import re
+import statistics
+import sys
+
+# Boot milestones, in the order they show up on the console
+MILESTONES = [
+    ("FIRMWARE",  r"(BOOTLOADER|Bootloader|MESS:\d|Read config\.txt|Read start)"),
+    ("KERNEL",    r"Booting Linux on physical CPU"),
+    ("INIT",      r"(Run /init as init process|Run /sbin/init as init process)"),
+    ("SYSTEMD",   r"systemd\[1\]"),
+    ("JOURNALD",  r"systemd-journald"),
+    ("MULTIUSER", r"Reached target .*[Mm]ulti-[Uu]ser"),
+    ("LOGIN",     r"( login:|\[press ENTER to login\]|@@BAKE\|\d+\|AGENT\|)"), # or bake_agent is up
+]
+MILESTONE_NAMES = [name for name, _ in MILESTONES]
+
+# What a boot starts from: power on, or asking for a tryboot reboot
+START_POWER_ON = "POWER_ON"
+START_TRYBOOT = "TRYBOOT"
+
+MIN_SAMPLES = 3   # Don't trust a transition we've seen fewer times than this
+STD_FACTOR = 4    # allowance = mean + STD_FACTOR * stddev ...
+MAX_FACTOR = 1.5  # ... but never less than the slowest boot we've seen * MAX_FACTOR
+MIN_ALLOWANCE = 10 # seconds
+
+# Matches the lines LogEntry.__str__ writes out
+LOG_LINE = re.compile(r"^\[#\d+; (\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\.\d+)\] (.*)$")
+TIME_FMT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def matchMilestone(line, after=-1):
+    " Index of the first milestone (later than `after`) that line matches, or None "
+    for i in range(after + 1, len(MILESTONES)):
+        if re.search(MILESTONES[i][1], line):
+            return i
+    return None
+
+
+def parseLog(path):
+    """ Splits a run log into boots: returns a list of (start_kind, [(seconds, line)])
+    with times relative to when the boot was kicked off """
+    boots = []
+    curr = None
+    start = None
+
+    with open(path, errors="replace") as f:
+        for raw in f:
+            m = LOG_LINE.match(raw.rstrip("\n"))
+            if not m:
+                continue
+            try:
+                t = datetime.datetime.strptime(m.group(1), TIME_FMT)
+            except ValueError:
+                continue
+            rest = m.group(2)
+
+            if rest.startswith("LOG_: Setting POWER=ON"):
+                curr = (START_POWER_ON, [])
+            elif rest.startswith("    > ") and (("tryboot" in rest and "reboot" in rest)
+                                                 or "|TRYBOOT|REQUEST|" in rest):
+                curr = (START_TRYBOOT, [])
+            elif rest.startswith("    < ") and curr is not None:
+                curr[1].append(((t - start).total_seconds(), rest[6:]))
+                continue
+            else:
+                continue
+
+            start = t
+            boots.append(curr)
+    return boots
+
+
+def milestoneTimes(lines):
+    " [(milestone_index, seconds)] for the milestones reached, in order "
+    reached = []
+    last = -1
+    for t, line in lines:
+        i = matchMilestone(line, last)
+        if i is not None:
+            reached.append((i, t))
+            last = i
+    return reached
+
+
+class BootModel:
+    """ Learned timing: for each place a boot can be (a start kind, or the last
+    milestone reached), how long until the next milestone shows up """
+
+    def __init__(self):
+        self.gaps = {} # from-state -> [seconds until next milestone]
+        self.boots = 0
+
+    @classmethod
+    def fromLogs(cls, log_dir):
+        model = cls()
+        for path in sorted(glob.glob(os.path.join(log_dir, "*.log"))):
+            for kind, lines in parseLog(path):
+                model.addBoot(kind, milestoneTimes(lines))
+        return model
+
+    def addBoot(self, kind, reached):
+        " Only learn from boots that made it all the way to a login prompt "
+        if not reached or MILESTONE_NAMES[reached[-1][0]] != "LOGIN":
+            return
+        self.boots += 1
+        prev, prev_t = kind, 0
+        for i, t in reached:
+            self.gaps.setdefault(prev, []).append(t - prev_t)
+            prev, prev_t = MILESTONE_NAMES[i], t
+
+    def allowance(self, state):
+        " Seconds to wait for the next milestone after state, or None if we don't know "
+        samples = self.gaps.get(state, [])
+        if len(samples) < MIN_SAMPLES:
+            return None
+        spread = statistics.mean(samples) + STD_FACTOR * statistics.pstdev(samples)
+        return max(spread, max(samples) * MAX_FACTOR, MIN_ALLOWANCE)
+
+    def __str__(self):
+        lines = [f"Learned from {self.boots} boots:"]
+        for state in [START_POWER_ON, START_TRYBOOT] + MILESTONE_NAMES:
+            samples = self.gaps.get(state)
+            if not samples:
+                continue
+            allow = self.allowance(state)
+            allowstr = f"{allow:6.1f}s" if allow is not None else "   (few)"
+            lines.append(f" {state:>10} -> next: n={len(samples):4} "
+                         f"mean={statistics.mean(samples):6.1f}s max={max(samples):6.1f}s allow={allowstr}")
+        return "\n".join(lines)
+
+
+class BootWatchdog:
+    " Watches a single boot: feed it console lines, ask it if the boot is overdue "
+
+    def __init__(self, model, kind=START_POWER_ON, start=None):
+        self.model = model
+        self.start = start or datetime.datetime.now()
+        self.last = -1            # index of the last milestone reached
+        self.lastState = kind     # name of the last milestone (or start kind)
+        self.lastTime = self.start
+        self.hang = None          # set to a message once we decide it's hung
+
+    @property
+    def lastMilestone(self):
+        return MILESTONE_NAMES[self.last] if self.last >= 0 else "NONE"
+
+    @property
+    def done(self):
+        return self.lastMilestone == "LOGIN"
+
+    def feed(self, line, t=None):
+        i = matchMilestone(line, self.last)
+        if i is not None:
+            self.last = i
+            self.lastState = MILESTONE_NAMES[i]
+            self.lastTime = t or datetime.datetime.now()
+
+    def overdue(self, now=None):
+        " Returns a message if the next milestone is overdue (i.e. it's hung), else None "
+        if self.hang or self.done:
+            return self.hang
+        allow = self.model.allowance(self.lastState)
+        if allow is None:
+            return None # Haven't seen enough boots to know, fall back to the usual timeouts
+        waited = ((now or datetime.datetime.now()) - self.lastTime).total_seconds()
+        if waited > allow:
+            self.hang = (f"hung after {self.lastState}: no milestone for {waited:.1f}s"
+                         f" (normally within {allow:.1f}s)")
+        return self.hang
+
+
+# ==================== MAIN
+
+if __name__ == "__main__":
+    print(BootModel.fromLogs(sys.argv[1] if len(sys.argv) > 1 else "output_logs"))
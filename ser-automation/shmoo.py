@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+# Shmoo (pass/fail matrix) aggregation over all sweep results
+#
+# results.csv only has config_args ("<config_id> <n>"), so each run gets
+# resolved back to its swept variables through gen_config.getVars, and binned
+# into a VOLTAGE x FREQUENCY grid per (board, config):
+# - runs, passes, pass_rate and mean time-to-fail (over the failing runs)
+#
+# Rows from before test_serial.py recorded board/stress_ok are legacy: that
+# tryRun always ran GenConf with n=0, whatever config_args says, so they're
+# binned as n=0.
+#
+# The engine remembers how far into results.csv it got, so update() only
+# parses the runs that landed since last time.
+#
+#     python3 shmoo.py output_logs/results.csv --out shmoo.npz
+
+import argparse
+import csv
+import io
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tgt_scripts"))
+import gen_config
+
+STRESS_FULL = 120 # seconds of stress a run needs to count as a pass (for old rows without stress_ok)
+
+
+def runOutcome(row):
+    """ Returns (passed, time_to_fail) for a results row, or None if the run
+    doesn't tell us anything about the config (e.g. it never got to tryboot) """
+    if row.get("boot_ok") != "True" or row.get("genconf_ok") != "True":
+        return None
+    if row.get("tryboot_ok") != "True":
+        return (False, 0) # Didn't even boot with the new config
+
+    try:
+        survived = int(float(row.get("stress_test") or 0))
+    except ValueError:
+        survived = 0
+    if row.get("stress_ok"):
+        passed = row["stress_ok"] == "True"
+    else:
+        passed = survived >= STRESS_FULL
+    return (passed, None if passed else survived)
+
+
+class ShmooGrid:
+    " Counts for a single (board, config), over that config's whole sweep space "
+
+    def __init__(self, conf_id, xvar, yvar):
+        allVars = gen_config.sweepSpace(conf_id)
+        self.xs = sorted({v[xvar] for v in allVars})
+        self.ys = sorted({v[yvar] for v in allVars})
+        shape = (len(self.xs), len(self.ys))
+        self.runs = np.zeros(shape, dtype=np.int32)
+        self.passes = np.zeros(shape, dtype=np.int32)
+        self.fails = np.zeros(shape, dtype=np.int32)
+        self.ttfSum = np.zeros(shape, dtype=np.float64)
+
+    def add(self, x, y, passed, ttf):
+        i, j = self.xs.index(x), self.ys.index(y)
+        self.runs[i, j] += 1
+        if passed:
+            self.passes[i, j] += 1
+        else:
+            self.fails[i, j] += 1
+            self.ttfSum[i, j] += ttf
+
+    def arrays(self):
+        " Compact arrays for plotting; cells with no runs are NaN "
+        with np.errstate(invalid="ignore", divide="ignore"):
+            pass_rate = np.where(self.runs > 0, self.passes / self.runs, np.nan)
+            ttf_mean = np.where(self.fails > 0, self.ttfSum / self.fails, np.nan)
+        return {
+            "x": np.array(self.xs), "y": np.array(self.ys),
+            "runs": self.runs.copy(), "passes": self.passes.copy(),
+            "pass_rate": pass_rate.astype(np.float32), "ttf_mean": ttf_mean.astype(np.float32),
+        }
+
+    def __str__(self):
+        " Text shmoo plot: one row per x, one column per y "
+        chars = []
+        for i, x in enumerate(self.xs):
+            row = "".join("." if self.runs[i, j] == 0
+                          else "P" if self.passes[i, j] == self.runs[i, j]
+                          else "F" if self.passes[i, j] == 0 else "~"
+                          for j in range(len(self.ys)))
+            chars.append(f"{x:>8} {row}")
+        return "\n".join(chars)
+
+
+class ShmooEngine:
+    def __init__(self, csvpath, xvar="VOLTAGE", yvar="FREQUENCY"):
+        self.csvpath = csvpath
+        self.xvar = xvar
+        self.yvar = yvar
+        self.reset()
+
+    def reset(self):
+        self.offset = 0     # how far into csvpath we've parsed
+        self.inode = None   # so we notice when test_serial rewrites it with new columns
+        self.lineno = 0
+        self.header = None
+        self.grids = {}     # (board, conf_id) -> ShmooGrid
+        self.skipped = 0    # rows we couldn't resolve / that weren't informative
+
+    def update(self):
+        " Parses any runs appended since the last update, returns how many got added "
+        if not os.path.exists(self.csvpath):
+            return 0
+        st = os.stat(self.csvpath)
+        if st.st_size < self.offset or (self.inode is not None and st.st_ino != self.inode):
+            self.reset() # File got replaced, start over
+        self.inode = st.st_ino
+
+        with open(self.csvpath, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+
+        # Only take complete lines, a run might be halfway through being written
+        end = data.rfind(b"\n") + 1
+        lines = data[:end].decode("utf-8", errors="replace").splitlines()
+        self.offset += end
+
+        if self.header is None and lines:
+            self.header = next(csv.reader([lines.pop(0)]))
+            self.lineno += 1
+
+        added = 0
+        for row in csv.DictReader(io.StringIO("\n".join(lines)), fieldnames=self.header):
+            self.lineno += 1
+            # Extra fields land under None, missing ones come back as None
+            if None in row or None in row.values():
+                raise ValueError(f"{self.csvpath} line {self.lineno}: row doesn't match the"
+                                 f" {len(self.header)} columns in the header, was it written"
+                                 f" by a different version of test_serial.py?")
+            if self.addRow(row):
+                added += 1
+            else:
+                self.skipped += 1
+        return added
+
+    def addRow(self, row):
+        try:
+            conf_id, n = row["config_args"].split()
+            n = int(n)
+        except (AttributeError, ValueError):
+            return False
+        if not row.get("board") and not row.get("stress_ok"):
+            n = 0 # Legacy row, see top
+
+        currVars = gen_config.getVars(conf_id, n)
+        outcome = runOutcome(row)
+        if currVars is None or outcome is None:
+            return False
+        if self.xvar not in currVars or self.yvar not in currVars:
+            return False
+
+        board = row.get("board") or "unknown"
+        key = (board, conf_id)
+        if key not in self.grids:
+            self.grids[key] = ShmooGrid(conf_id, self.xvar, self.yvar)
+        self.grids[key].add(currVars[self.xvar], currVars[self.yvar], *outcome)
+        return True
+
+    def matrix(self, board, conf_id):
+        return self.grids[(board, conf_id)].arrays()
+
+    def export(self, path):
+        " Writes every grid to one .npz, with keys like '<board>/<config_id>/pass_rate' "
+        out = {}
+        for (board, conf_id), grid in self.grids.items():
+            for name, arr in grid.arrays().items():
+                out[f"{board}/{conf_id}/{name}"] = arr
+        np.savez_compressed(path, **out)
+
+
+# ==================== MAIN
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="shmoo.py",
+                description="Builds VOLTAGE x FREQUENCY pass/fail matrices from results.csv")
+    parser.add_argument("csvfile", nargs="?", default=os.path.join("output_logs", "results.csv"))
+    parser.add_argument("-o", "--out", help="write all matrices to this .npz")
+    parser.add_argument("--x", help="variable for the rows", default="VOLTAGE")
+    parser.add_argument("--y", help="variable for the columns", default="FREQUENCY")
+    args = parser.parse_args()
+
+    engine = ShmooEngine(args.csvfile, args.x, args.y)
+    added = engine.update()
+    print(f"Read {added} runs ({engine.skipped} skipped) from {args.csvfile}")
+
+    for (board, conf_id), grid in sorted(engine.grids.items()):
+        print(f"\n=== {board} / {conf_id}  ({args.x} down, {args.y} across: {grid.ys})")
+        print(grid)
+
+    if args.out:
+        engine.export(args.out)
+        print(f"\nWrote matrices to {args.out}")
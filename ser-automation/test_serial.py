@@ -1,5 +1,6 @@
 #!/usr/bin/python3
 import argparse
+import csv
 import serial
 from enum import Enum
 import datetime
@@ -9,9 +10,24 @@ import select
 import re
 import itertools
 import os
+import shutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tgt_scripts"))
+import bake_frame
+import boot_watchdog
+import bake_trace
+import gen_config
+import result_cache
+import tryboot_render
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "experiments"))
+import sweep_scheduler
 
 OUTPUT_DIR="output_logs"
 CSV_NAME="results.csv"
+CACHE_PATH=os.path.join(OUTPUT_DIR, result_cache.CACHE_NAME)
+# What scr_StressTest() runs by default, for the result cache key
+STRESS_METHOD="step_stress"
+STRESS_DURATION="4x30s"
 
 # ================ TODOS
 # (on pi)
@@ -50,6 +66,7 @@ class LType(Enum):
   SEND = 2
   LOG_ = 3
   RSLT = 4
+  FRAM = 5 # a parsed bake_frame.Frame (data is the Frame)
   ERR_ = 10 # Debug levels: 0 is almost always too verbose
   DBG0 = 20 # Debug levels: 0 is almost always too verbose
             #               10 is almost always shown
@@ -77,16 +94,17 @@ class ScrResult:
     "Result of a script run"
     # TODO: split this into timeouts? ERROR results from commands? etc?
 
-    def __init__(self, ok, msg, value=None):
+    def __init__(self, ok, msg, value=None, frame=None):
         "If  a result has a sensible value other than Success/Failure, put it in value"
         self.ok = ok
         self.resultValue = value
         self.msg = msg
+        self.frame = frame # the bake_frame.Frame this result came from (if any)
 
 # Conceptually this is getting closer to a "TestRun" object
 # I should try to factor out the serial stuff maybe?
 class SerialInterface:
-    def __init__(self, port, baudrate=115200, timeout=0.25):
+    def __init__(self, port, baudrate=115200, timeout=0.25, bootModel=None, agent=False):
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
@@ -95,6 +113,15 @@ class SerialInterface:
                    timeout=timeout, rtscts=False, dsrdtr=False)
         self.logEntries = []
         self.entry_counter = 0
+        self.frameParser = bake_frame.FrameParser()
+        self.lastFrameSeq = None
+        self.framesSinceSend = set() # to drop the repeat copies of final frames
+        # Learned boot timings (see boot_watchdog.py); empty means never call a hang early
+        self.bootModel = bootModel or boot_watchdog.BootModel()
+        self.tracer = bake_trace.Tracer()
+        # Talk to bake_agent.py with REQUEST frames, instead of a shell
+        self.agent = agent
+        self.agentSeq = 0
 
         # Meaningful state
         self.results = {}
@@ -145,8 +172,9 @@ class SerialInterface:
 
         # TODO: centralize this / chekc it somehow?
         # All the result columns we're writing to the CSV
-        keys = [ "runid", "config_args", "boot_ok", "genconf_ok",
-                "tryboot_ok", "stress_test"]
+        keys = [ "runid", "board", "config_args", "boot_ok", "genconf_ok",
+                "tryboot_ok", "stress_test", "stress_ok",
+                "boot_verdict", "boot_milestone", "tryboot_verdict", "tryboot_milestone"]
         resultsline = ",".join( str(self.results.get(k,"")) for k in keys)
         self.log(f"Appending results to {csvpath}: {resultsline}")
 
@@ -154,11 +182,20 @@ class SerialInterface:
         if not os.path.exists(csvpath):
             with open(csvpath, "a") as f:
                 f.write(",".join(keys) + "\n")
+        else:
+            self._migrateCsv(csvpath, keys)
 
 
         with open(csvpath, "a") as f:
             f.write(resultsline + "\n")
 
+        # === Timing: where did this run's time go?
+        tracepath = os.path.join(OUTPUT_DIR, f"{self.results['runid']}.trace.json")
+        print(f"Writing trace to {tracepath}")
+        self.tracer.writeChrome(tracepath, self.results["runid"])
+        spans = [(sp.name, sp.cat, sp.duration, sp.args) for sp in self.tracer.spans]
+        print(bake_trace.formatStats(bake_trace.phaseStats(spans)))
+
         logpath =  os.path.join(OUTPUT_DIR, logfile)
         print(f"Writing log to {logpath}")
 
@@ -176,6 +213,27 @@ class SerialInterface:
 
 
 
+    def _migrateCsv(self, csvpath, keys):
+        """ If results.csv was written with different columns (older version of
+        this script), rewrite it with the current ones so rows keep lining up
+        with the header. The old file is kept as results.csv.<timestamp>.bak """
+        with open(csvpath, newline="") as f:
+            header = next(csv.reader(f), None)
+            if header == keys:
+                return
+            rows = list(csv.DictReader(f, fieldnames=header))
+
+        backup = f"{csvpath}.{datetime.datetime.now().strftime('%Y%m%dT%H%M%S')}.bak"
+        shutil.copy2(csvpath, backup)
+        self.log(f"{csvpath} has old columns {header}, rewriting it with {keys} (backup in {backup})")
+        tmp = csvpath + ".tmp"
+        with open(tmp, "w", newline="") as f:
+            f.write(",".join(keys) + "\n")
+            for row in rows:
+                f.write(",".join(str(row.get(k) or "") for k in keys) + "\n")
+        os.replace(tmp, csvpath)
+
+
     # ============= Serial stuff?
 
 
@@ -223,14 +281,26 @@ class SerialInterface:
         #    self.ser.open()
         self.ser.write((data + '\n').encode('utf-8'))
         self._addLogEntry(LType.SEND, data)
+        self.framesSinceSend = set()
 
-    def read(self, max_time=5, silent_time=1):
+    def read(self, max_time=5, silent_time=1, until=None, stop=None):
         """ Try to read data for up to a certain number of seconds.
         Will stop reading once it goes timeout seconds without any
         data, or when it hits max_time or MAX_DATA
 
+        If until is given, it's called on each BAKE frame that comes in,
+        and reading stops as soon as it returns True
+        If stop is given, it's called every time around the loop, and reading
+        stops as soon as it returns something truthy (a string says why, for
+        the trace, e.g. "hang")
+
         Returns True if timed out (too much data)
         """
+        with self.tracer.span("read", cat="read", max_time=max_time, silent_time=silent_time) as sp:
+            return self._read(sp, max_time, silent_time, until, stop)
+
+    def _read(self, sp, max_time, silent_time, until, stop):
+        " The actual read loop: records how it ended (match/stopped/silence/max_time) in sp "
         MAX_DATA = 1 * MB
         MAX_TIMEOUT = max_time
         SILENT_TIMEOUT = silent_time
@@ -240,6 +310,7 @@ class SerialInterface:
 
         start_time = time.time()
         last_data = time.time()
+        sp.args.update(bytes=0, silence_wait=0)
 
         self.dbg(f"Reading: max time {MAX_TIMEOUT}s, gap time {SILENT_TIMEOUT}s")
 
@@ -248,8 +319,15 @@ class SerialInterface:
 
             if elapsed_time > MAX_TIMEOUT:
                 self.dbg(f"read timed out: {elapsed_time}s elapsed")
+                sp.args["end"] = "max_time"
                 return True # timed out: too much data
 
+            reason = stop() if stop is not None else None
+            if reason:
+                self.dbg(f"read stopped early ({reason})")
+                sp.args["end"] = reason if isinstance(reason, str) else "stopped"
+                return False
+
             # if
             #if self.ser.in_waiting:
 
@@ -261,10 +339,18 @@ class SerialInterface:
 
             if line:
                 last_data = time.time()
+                sp.args["bytes"] += len(line)
+                frames = self.frameParser.feed(line)
                 if line.endswith(b"\n"):
                     line = line[:-1]
                 line = line.decode('utf-8', errors='replace')
                 self._addLogEntry(LType.RECV, line)
+
+                frames = [frame for frame in frames if self._addFrame(frame)]
+                if until is not None and any(until(f) for f in frames):
+                    self.dbg("read done: got the frame we were waiting for")
+                    sp.args["end"] = "match"
+                    return False
             else:
                 # No data, let's sleep for a bit
                 elapsed_since_data = time.time() - last_data
@@ -272,6 +358,8 @@ class SerialInterface:
                     # We haven't had any data in a while, other
                     # end isprobably done sending
                     self.dbg(f"read timed out: {elapsed_since_data:.1f}s with no data")
+                    sp.args["end"] = "silence"
+                    sp.args["silence_wait"] = elapsed_since_data
                     return False
 
                 # no data: let's keep sleeping
@@ -279,6 +367,19 @@ class SerialInterface:
 
         #data += self.ser.read(self.ser.in_waiting)
 
+    def _addFrame(self, frame):
+        " Logs a frame, returns False if it's a repeat of one we already have "
+        key = (frame.seq, frame.step, frame.status, tuple(sorted(frame.data.items())))
+        if key in self.framesSinceSend:
+            return False
+        self.framesSinceSend.add(key)
+        # seq restarts at 0 for every new helper, otherwise it should count up
+        if frame.seq != 0 and self.lastFrameSeq is not None and frame.seq != self.lastFrameSeq + 1:
+            self.dbg(f"frame seq jumped from {self.lastFrameSeq} to {frame.seq}, lost some frames?")
+        self.lastFrameSeq = frame.seq
+        self._addLogEntry(LType.FRAM, frame)
+        return True
+
     def close(self):
         if self.ser.is_open:
             self.ser.close()
@@ -294,6 +395,7 @@ class SerialInterface:
         return [l for l in self.logEntries if l.type == ltype]
     def allRecv(self): return self.allOfType(LType.RECV)
     def allSend(self): return self.allOfType(LType.SEND)
+    def allFrames(self): return self.allOfType(LType.FRAM)
 
     # ====
 
@@ -309,6 +411,18 @@ class SerialInterface:
     #    " returns iterator of all sent lines in reverse order "
     #    return filter(lambda x: x.type == LType.SEND, reversed(self.logEntries))
 
+    def framesSinceLastSent(self, step=None):
+        " All frames received since the last command we sent (optionally just for one step) "
+        lSent = self.lastSentLine()
+        since = lSent.entry_number if lSent is not None else -1
+        return [e.data for e in self.allFrames()
+                if e.entry_number > since and (step is None or e.data.step == step)]
+
+    def finalFrame(self, step):
+        " The SUCCESS/FAIL frame for step since the last command we sent, or None "
+        finals = [f for f in self.framesSinceLastSent(step) if f.final]
+        return (finals or [None])[-1]
+
     def checkLastLine(self,pattern):
         " Given a regex, returns true if last line matched this pattern "
         # TODO: generalize this? want to check if
@@ -316,28 +430,57 @@ class SerialInterface:
             return False
         return re.search(pattern, self.lastReceivedLine().data)
 
-    def runCommandAndCheckOutput(self, cmd, pattern):
+    def runStep(self, cmd, step, max_time=5, silent_time=1):
         """ sends a command as a string,
-        Waits until command completes (i.e. we return to a prompt)
-        Checks the second-last line (i.e. last line of output) against pattern
+        Reads until the helper sends back a final (SUCCESS/FAIL) frame for step,
+        or until the read times out
 
-        Returns a failure if the command timed out or if output didn't match pattern
+        Returns a ScrResult with the frame attached (failure if we never got one)
         """
 
-        assert False, "NOT IMPLEMENTED"
-
         self.send(cmd)
-        self.read()
-        if not self.checkAtPrompt():
-            return # TODO: return failure code
+        self.read(max_time=max_time, silent_time=silent_time,
+                  until=lambda f: f.step == step and f.final)
+        frame = self.finalFrame(step)
+
+        if frame is None:
+            self.err(f"Command Failed (no {step} result frame)")
+            return ScrResult(False, f"{step} never reported back")
+
+        # Let the rest of the output / the prompt come in
+        self.read(max_time=5, silent_time=0.5)
+
+        if not frame.ok:
+            self.err(f"Command Failed ({step}|{frame.status}: {frame.get('msg', '')})")
+        return ScrResult(frame.ok, frame.get("msg", ""), frame=frame)
+
+
+    def agentCall(self, cmd, max_time=10, silent_time=5, **args):
+        """ Sends a REQUEST frame to bake_agent.py, and reads until its final
+        reply (frames answering us carry req=<our seq>)
 
-        lastOut = self.allRecv()[-2] # second last line
-        if lastOut is None or not re.search(pattern, lastOut.data):
-            return # TODO: return failure code
+        Returns a ScrResult with the reply frame attached """
+        req = bake_frame.Frame(self.agentSeq, cmd, bake_frame.REQUEST,
+                               {k: str(v) for k, v in args.items()})
+        self.agentSeq += 1
 
-        # Success!
-        return # TODO :return success code
+        def isReply(f):
+            return f.final and f.get("req") == str(req.seq)
 
+        self.send(req.encode())
+        self.read(max_time=max_time, silent_time=silent_time, until=isReply)
+        replies = [f for f in self.framesSinceLastSent() if isReply(f)]
+
+        if not replies:
+            self.err(f"Agent didn't answer {cmd}")
+            return ScrResult(False, f"agent never answered {cmd}")
+        frame = replies[-1]
+
+        # Soak up the repeat copies of the reply, so they're not logged under our next request
+        self.read(max_time=5, silent_time=0.5)
+        if not frame.ok:
+            self.err(f"Agent {cmd} failed: {frame.get('msg', '')}")
+        return ScrResult(frame.ok, frame.get("msg", ""), frame=frame)
 
     # ================= BUILDING BLOCKS ======================
 
@@ -363,24 +506,59 @@ class SerialInterface:
     # A specific task: i.e. generate a series of commands, listen for responses,
     # return a ScrResult
 
-    def scr_AwaitBoot(self):
-        " "
+    def scr_AwaitBoot(self, key="boot", kind=boot_watchdog.START_POWER_ON):
+        """ Reads until boot finishes. The watchdog compares progress against
+        boot timings learned from old logs, and if the next boot milestone is
+        overdue we call it hung, power cycle right away and fail
+
+        Records {key}_verdict (ok / hang / no_login) and {key}_milestone """
+        watchdog = boot_watchdog.BootWatchdog(self.bootModel, kind)
+        seen = len(self.logEntries)
+
+        def hung():
+            nonlocal seen
+            for entry in self.logEntries[seen:]:
+                if entry.type == LType.RECV:
+                    watchdog.feed(entry.data, entry.timestamp)
+            seen = len(self.logEntries)
+            if watchdog.overdue():
+                return "hang"
+            # The agent says when it's up, no need to wait for silence
+            if self.agent and watchdog.done:
+                return "booted"
+            return None
+
         # Read for the full boot time
         #self.read(max_time=60, silent_time=1) #DEBUG: exit quickly
-        self.read(max_time=120, silent_time=20)
+        self.read(max_time=120, silent_time=20, stop=hung)
 
         # sometimes journald takes a while
-        if self.checkLastLine("systemd-journald"):
+        if not watchdog.hang and not watchdog.done and self.checkLastLine("systemd-journald"):
             # Wait for journal check (takes a while)
             #self.read(max_time=15, silent_time=1) #DEBUG: exit quickly
-            self.read(max_time=15, silent_time=15)
+            self.read(max_time=15, silent_time=15, stop=hung)
 
-        return ScrResult(True, "")
-        # TODO: this should check for login msg?
+        if watchdog.hang:
+            self.recordResult(f"{key}_verdict", "hang", watchdog.hang)
+            self.recordResult(f"{key}_milestone", watchdog.lastMilestone, "")
+            self.reboot() # Don't wait out the timeout, power cycle now
+            return ScrResult(False, watchdog.hang, value=watchdog.lastMilestone)
+
+        verdict = "ok" if watchdog.done else "no_login"
+        self.recordResult(f"{key}_verdict", verdict, "")
+        self.recordResult(f"{key}_milestone", watchdog.lastMilestone, "")
+        return ScrResult(watchdog.done, "", value=watchdog.lastMilestone)
 
     def scr_Login(self):
         "Call this after boot completes"
 
+        if self.agent:
+            # No login with the agent: just make sure it's answering
+            res = self.agentCall("PING")
+            if not res.ok:
+                return ScrResult(False, "Agent not responding after boot")
+            return ScrResult(True, "Agent is up")
+
         # Because of the tty / systemd bullshit, sometimes it prompts and sometimes it auto-logs in
         if self.checkLastLine("raspberrypi login:"):
             # successfully booted, send uname and pw
@@ -408,54 +586,69 @@ class SerialInterface:
 
 
 
-    def scr_GenConf(self, conf_id, n):
-        self.send("cd ~/easy_bake/ser-automation/tgt_scripts")
-        self.read()
-        if not self.checkAtPrompt():
-            self.err("Command Failed (not at prompt)")
-            return ScrResult(False, "cd failed?")
-
-        self.send(f"python3 gen_config.py {conf_id} {n} --out new_tryboot.txt")
-        self.read()
-        if not self.checkAtPrompt():
-            self.err("Command Failed (not at prompt)")
-            return ScrResult(False, "gen_config timed out")
+    def scr_Firmware(self):
+        """ Asks the pi which firmware it's running (the `vcgencmd version` hash),
+        so cached results can be tied to it. Records firmware, returns it (or None) """
+        fw = None
+        if self.agent:
+            res = self.agentCall("TELEMETRY")
+            if res.ok:
+                fw = res.frame.get("firmware") or None
+        else:
+            self.send("vcgencmd version")
+            self.read(max_time=5, silent_time=1)
+            lSent = self.lastSentLine()
+            for entry in self.allRecv():
+                m = re.match(r"\s*version ([0-9a-f]{7,})", entry.data)
+                if entry.entry_number > lSent.entry_number and m:
+                    fw = m.group(1)
+        self.recordResult("firmware", fw, "")
+        return fw
 
-        lastOut = self.allRecv()[-2] # second last line
-        if lastOut is None or not re.search("BAKE-STEP\|[A-Z_]*\|SUCCESS", lastOut.data):
-            self.err("Command Failed (didn't find BAKE-STEP|SUCCESS)")
-            return ScrResult(False, "gen_config failed")
+    def scr_GenConf(self, conf_id, n):
+        """ Renders the config straight into /boot/firmware/tryboot.txt on the pi
+        (gen_config skips the write if it's already identical) """
+        if self.agent:
+            res = self.agentCall("INSTALL", config_id=conf_id, n=n)
+        else:
+            res = self.runStep("sudo python3 ~/easy_bake/ser-automation/tgt_scripts/gen_config.py"
+                               + f" {conf_id} {n} --install", "GEN_CONFIG")
+        if not res.ok:
+            return ScrResult(False, f"gen_config failed: {res.msg}", frame=res.frame)
+
+        written = "wrote" if res.frame.get("changed") == "1" else "unchanged"
+        return ScrResult(True, f"Successfully generated config for '{conf_id} {n}'"
+                         + f" (tryboot.txt {written}, {res.frame.get('hash')})", frame=res.frame)
+
+    def scr_StressTest(self, iters=4, duration=30, beat=5):
+        """ Runs step_stress.py, which heartbeats every `beat` seconds: if the
+        pi goes quiet for a few beats, it's hung and we stop waiting """
+        if self.agent:
+            res = self.agentCall("STRESS", iters=iters, time=duration, beat=beat,
+                                 max_time=iters * duration + 30, silent_time=3 * beat)
+        else:
+            res = self.runStep("python3 ~/easy_bake/ser-automation/tgt_scripts/step_stress.py"
+                               + f" --iters {iters} --time {duration} --beat {beat}", "STRESS",
+                               max_time=iters * duration + 30, silent_time=3 * beat)
+
+        if res.frame is None:
+            # Pi went quiet: the last heartbeat/progress frame tells us how long it lasted
+            beats = self.framesSinceLastSent("STRESS")
+            survived = beats[-1].get("elapsed", 0, int) if beats else 0
+            return ScrResult(False, f"stress test stopped reporting after {survived}s",
+                             value=survived)
+
+        survived = res.frame.get("survived", 0, int)
+        if not res.ok:
+            return ScrResult(False, f"stress test failed at iter {res.frame.get('iter')}",
+                             value=survived, frame=res.frame)
+        return ScrResult(True, f"Succesfully ran {iters} iterations of stress",
+                         value=survived, frame=res.frame)
 
-        self.send(f"sudo cp new_tryboot.txt /boot/firmware/tryboot.txt"
-                  +" && echo 'BAKE-STEP|CP|SUCCESS|'")
-        self.read()
-        if not self.checkAtPrompt():
-            self.err("Command Failed (not at prompt)")
-            return ScrResult(False, "sudo cp timed out")
-        lastOut = self.allRecv()[-2] # second last line
-        if lastOut is None or not re.search("BAKE-STEP\|[A-Z_]*\|SUCCESS", lastOut.data):
-            self.err("Command Failed (didn't find BAKE-STEP|SUCCESS)")
-            return ScrResult(False, "sudo cp didn't succeed")
-
-        return ScrResult(True, f"Successfully generated config for '{conf_id} {n}'")
-
-    def scr_StressTest(self,iters=4):
-      for i in range(iters):
-        self.send("stress -c 4 -t 30 && echo 'BAKE-STEP|STRESS|SUCCESS|'")
-        self.read(max_time=40, silent_time=35) # Make sure we wait long enough for the run to complete
-        if not self.checkAtPrompt():
-          self.err("Command Failed (not at prompt)")
-          return ScrResult(False, f"stress test prompt failed at iter {i}",value=30*i)
-        
-        lastOut = self.allRecv()[-2] # second last line
-      
-        if lastOut is None or not re.search("BAKE-STEP\|[A-Z_]*\|SUCCESS|", lastOut.data):
-          self.err("Command Failed (didn't find BAKE-STEP|SUCCESS)")
-          return ScrResult(False, f"stress test failed at iter {i}",value=30*i)
-
-      return ScrResult(True, f"Succesfully ran {i} iterations of stress",value=30*iters)
-    
     def scr_Tryboot(self):
+        if self.agent:
+            self.agentCall("TRYBOOT")
+            return
         self.send(f"sudo reboot '0 tryboot'")
         pass
 
@@ -521,26 +714,35 @@ class SerialInterface:
 # # ============= END TESTING CODE
 
 
-def tryRun(self, runname, config_id, config_n):
+def tryRun(self, runname, config_id, config_n, board="unknown"):
     assert not " " in runname, "runname should have no spaces"
     assert not " " in config_id, "config_id should have no space"
     assert isinstance(config_n, int), "n should be an int"
 
     runid = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S") + str(runname)
     self.recordResult("runid", runid, " === Starting run ===")
+    self.recordResult("board", board, "")
     self.recordResult("config_args", f"{config_id} {config_n}", "")
 
-    self.reboot()
+    span = self.tracer.span
+    with span("reboot"):
+        self.reboot()
 
-    self.scr_AwaitBoot()
+    with span("scr_AwaitBoot"):
+        self.scr_AwaitBoot()
 
-    res = self.scr_Login() #Log in to pi
+    with span("scr_Login"):
+        res = self.scr_Login() #Log in to pi
     self.recordResult("boot_ok", res.ok, res.msg)
     if not res.ok:
         return
 
+    with span("scr_Firmware"):
+        self.scr_Firmware()
+
 
-    res = self.scr_GenConf(config_id, 0)
+    with span("scr_GenConf"):
+        res = self.scr_GenConf(config_id, config_n)
     self.recordResult("genconf_ok", res.ok, res.msg)
     if not res.ok:
         return
@@ -548,35 +750,122 @@ def tryRun(self, runname, config_id, config_n):
     # ==== All generated, now time to reboot
     # (return here if we want to just boot and debug interactively)
 
-    serint.scr_Tryboot()
-    serint.scr_AwaitBoot()
-    res = serint.scr_Login() #Log in to pi
+    with span("scr_Tryboot"):
+        self.scr_Tryboot()
+    with span("scr_AwaitBoot(tryboot)"):
+        self.scr_AwaitBoot("tryboot", boot_watchdog.START_TRYBOOT)
+    with span("scr_Login(tryboot)"):
+        res = self.scr_Login() #Log in to pi
     self.recordResult("tryboot_ok", res.ok, res.msg)
     if not res.ok:
         return
 
-    res_stress = serint.scr_StressTest()
+    with span("scr_StressTest"):
+        res_stress = self.scr_StressTest()
     self.recordResult("stress_test",res_stress.resultValue, res_stress.msg)
+    self.recordResult("stress_ok", res_stress.ok, "")
     if not res_stress.ok:
       return
 
+def runPassed(results):
+    """ True/False if the run says something about the config,
+    None if it died before trying the config (i.e. don't count it) """
+    if results.get("boot_ok") is not True or results.get("genconf_ok") is not True:
+        return None
+    return results.get("stress_ok") is True
+
+def confHash(config_id, n):
+    """ Hash of the tryboot.txt gen_config will install on the pi for this run
+    (rendered here from the same templates), or None if it won't render """
+    try:
+        return tryboot_render.contentHash(gen_config.Config(config_id).genConf(n))
+    except gen_config.ConfigError:
+        return None
+
+def runsToDo(args):
+    """ Yields (config_id, n): every run in config_id's sweep space, or whatever
+    the sweep scheduler hands us (reporting each run's result back to it) """
+    if not args.scheduler:
+        for i in range(len(gen_config.sweepSpace(args.config_id))):
+            yield (args.config_id, i)
+        return
+
+    host, port = args.scheduler.rsplit(":", 1)
+    item_id = passed = None
+    while True:
+        item = sweep_scheduler.nextItem(host, int(port), args.board, item_id, passed)
+        if item is None:
+            print("Scheduler has no more work for us")
+            return
+        results = yield (item["config_id"], item["n"])
+        item_id, passed = item["id"], runPassed(results)
+
 parser=argparse.ArgumentParser()
-parser.add_argument("config_id",help="name of the config file to run")
+parser.add_argument("config_id",help="name of the config file to run", nargs="?")
+parser.add_argument("--board",help="which pi is on the other end (goes in results.csv)", default="unknown")
+parser.add_argument("--scheduler",help="HOST:PORT of experiments/sweep_scheduler.py to get runs from")
+parser.add_argument("--agent",help="the pi runs bake_agent.service instead of a login shell", action="store_true")
+result_cache.addArgs(parser)
 args=parser.parse_args()
-for i in range(9):
+if not args.config_id and not args.scheduler:
+    parser.error("need a config_id (or --scheduler)")
+if args.scheduler and args.board == "unknown":
+    # The scheduler tracks each board's edge by name: they'd all be "unknown"
+    parser.error("--scheduler needs --board")
+
+# Learn how long boots normally take from previous runs
+bootModel = boot_watchdog.BootModel.fromLogs(OUTPUT_DIR)
+print(bootModel)
+
+# Remember results across sessions (needs --board, so we know whose results they are)
+cache = result_cache.fromArgs(args, CACHE_PATH) if args.board != "unknown" else None
+if cache is None:
+    print("No --board given: not using the result cache")
+elif not args.firmware:
+    # Each run asks the pi (scr_Firmware): until one has, we can't tell
+    # which cached results still hold, so don't skip anything
+    print("No --firmware given: not skipping cached points until we've asked the pi")
+
+runs = runsToDo(args)
+results = None
+while True:
+    try:
+        config, i = runs.send(results)
+    except StopIteration:
+        break
+
+    chash = confHash(config, i) if cache else None
+    if chash and not args.no_cache and cache.firmware:
+        verdict = cache.verdict(args.board, chash, STRESS_METHOD, STRESS_DURATION)
+        if verdict is not None:
+            print(f"\n==== SKIPPING RUN {i}: '{config} {i}' already known to "
+                  f"{'pass' if verdict else 'fail'} on {args.board} ===\n")
+            # Looks like a real run to the scheduler, so it counts towards the point
+            results = {"boot_ok": True, "genconf_ok": True, "stress_ok": verdict, "cached": True}
+            continue
+
     # new main
     print(f"\n==== STARTING RUN {i} ===\n\n")
-    serint = SerialInterface(DEV)
+    serint = SerialInterface(DEV, bootModel=bootModel, agent=args.agent)
     serint.open()
     serint.reboot()
-    config=args.config_id
     print(f"\n CONFIG ID: {config}\n")
-    tryRun(serint, "test_debug", config, i)
+    with serint.tracer.span("tryRun", cat="run"):
+        tryRun(serint, "test_debug", config, i, args.board)
     #serint.read(max_time=10)
 
     print("\n\n\n==== RUN RESULTS ===")
     print(serint.results)
     serint.writeOutResults()
+    results = serint.results
+    fw = results.get("firmware")
+    if cache and fw and fw != cache.firmware:
+        if cache.firmware:
+            print(f"Pi is running firmware {fw}, not {cache.firmware}: only trusting results from {fw}")
+        cache.firmware = fw
+    if chash and runPassed(results) is not None:
+        cache.record(args.board, chash, STRESS_METHOD, STRESS_DURATION, runPassed(results),
+                     runid=results.get("runid"), config_args=f"{config} {i}")
 
     serint.close()
 
@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+# Long-lived bake agent, started by bake_agent.service
+#
+# Instead of logging in, scraping the shell prompt, and starting a fresh
+# python3 for every step (over a second each on an undervolted 3B), the host
+# sends REQUEST frames (see bake_frame.py) and the agent answers each one with
+# frames carrying req=<request seq>:
+#
+#     PING                          -> SUCCESS
+#     RENDER    config_id n         -> SUCCESS hash, vars (nothing written)
+#     INSTALL   config_id n         -> SUCCESS hash, changed (see tryboot_render.install)
+#     STRESS    iters time beat     -> HEARTBEAT/PROGRESS ..., then SUCCESS/FAIL survived
+#     TELEMETRY                     -> SUCCESS temp, volt, arm_hz, core_hz, throttled, firmware
+#     TRYBOOT                       -> SUCCESS, then reboots into tryboot
+#
+# On startup it sends an AGENT|HEARTBEAT ready=1 frame, so the host knows
+# boot is done without waiting for a login prompt.
+#
+#     bake_agent.py --serial /dev/serial0      (needs the serial getty disabled)
+#     bake_agent.py --tcp 5160                 (localhost only, unless --bind is given:
+#                                               there's no auth, and we run as root)
+
+import argparse
+import os
+import socket
+import subprocess
+import termios
+import tty
+
+import bake_frame
+import gen_config
+import step_stress
+import tryboot_render
+
+
+class ByteOut:
+    " Lets a FrameWriter write to a binary file / socket "
+
+    def __init__(self, write):
+        self._write = write
+
+    def write(self, s):
+        self._write(s.encode("ascii"))
+
+    def flush(self):
+        pass
+
+
+class ReplyWriter:
+    " A FrameWriter that tags every frame with the request it's answering "
+
+    def __init__(self, writer, req):
+        self.writer = writer
+        self.req = req
+
+    def emit(self, step, status, **data):
+        return self.writer.emit(step, status, req=self.req, **data)
+
+
+def vcgencmd(*args):
+    try:
+        out = subprocess.run(["vcgencmd", *args], capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return out.strip().split("=", 1)[-1] if "=" in out else None
+
+
+def firmwareTag():
+    " The firmware build hash from `vcgencmd version` (its 'version <hash> ...' line) "
+    try:
+        out = subprocess.run(["vcgencmd", "version"], capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    for line in out.splitlines():
+        if line.startswith("version "):
+            return line.split()[1]
+    return None
+
+
+def renderConf(req):
+    " Renders a gen_config config, raises ValueError with a message on bad args "
+    try:
+        conf_id, n = req.data["config_id"], int(req.data["n"])
+    except (KeyError, ValueError):
+        raise ValueError("need config_id and n")
+    try:
+        conf = gen_config.Config(conf_id)
+        return conf.genConf(n), conf.getAllVars()[n]
+    except gen_config.ConfigError as e:
+        raise ValueError(str(e)) from None
+
+
+def cmdPing(req, out):
+    return out.emit(req.step, bake_frame.SUCCESS, pid=os.getpid())
+
+def cmdRender(req, out):
+    content, currVars = renderConf(req)
+    return out.emit(req.step, bake_frame.SUCCESS,
+                    hash=tryboot_render.contentHash(content)[:16], **currVars)
+
+def cmdInstall(req, out):
+    content, currVars = renderConf(req)
+    # Always tryboot.txt: the request doesn't get to pick where root writes
+    changed, digest = tryboot_render.install(content, tryboot_render.TRYBOOT_PATH)
+    return out.emit(req.step, bake_frame.SUCCESS, hash=digest[:16], changed=int(changed), **currVars)
+
+def cmdStress(req, out):
+    # step_stress emits its frames with STEP=STRESS, which is also our step name
+    return step_stress.runStress(out, req.get("iters", 4, int), req.get("time", 30, int),
+                                 req.get("beat", 5, int))
+
+def cmdTelemetry(req, out):
+    return out.emit(req.step, bake_frame.SUCCESS,
+                    temp=vcgencmd("measure_temp") or step_stress.readTemp(),
+                    volt=vcgencmd("measure_volts", "core"),
+                    arm_hz=vcgencmd("measure_clock", "arm"),
+                    core_hz=vcgencmd("measure_clock", "core"),
+                    throttled=vcgencmd("get_throttled"),
+                    firmware=firmwareTag())
+
+def cmdTryboot(req, out):
+    frame = out.emit(req.step, bake_frame.SUCCESS, msg="rebooting into tryboot")
+    subprocess.Popen(["reboot", "0 tryboot"])
+    return frame
+
+COMMANDS = {
+    "PING": cmdPing,
+    "RENDER": cmdRender,
+    "INSTALL": cmdInstall,
+    "STRESS": cmdStress,
+    "TELEMETRY": cmdTelemetry,
+    "TRYBOOT": cmdTryboot,
+}
+
+
+def handle(req, writer):
+    " Runs one REQUEST frame, always answers with a final frame "
+    out = ReplyWriter(writer, req.seq)
+    cmd = COMMANDS.get(req.step)
+    if cmd is None:
+        return out.emit(req.step, bake_frame.FAIL, msg=f"unknown command {req.step}")
+    try:
+        return cmd(req, out)
+    except (ValueError, OSError, tryboot_render.RenderError) as e:
+        return out.emit(req.step, bake_frame.FAIL, msg=str(e))
+
+
+def serve(read, write):
+    " Reads requests with read() until it returns b'' (connection closed) "
+    writer = bake_frame.FrameWriter(ByteOut(write))
+    parser = bake_frame.FrameParser()
+    writer.emit("AGENT", bake_frame.HEARTBEAT, ready=1, pid=os.getpid())
+
+    while True:
+        data = read()
+        if not data:
+            return
+        for frame in parser.feed(data):
+            if frame.status == bake_frame.REQUEST:
+                handle(frame, writer)
+
+
+def openSerial(dev, baud=termios.B115200):
+    " Raw 115200 8N1, no echo (so the host doesn't see its own requests) "
+    fd = os.open(dev, os.O_RDWR | os.O_NOCTTY)
+    tty.setraw(fd)
+    attrs = termios.tcgetattr(fd)
+    attrs[4] = attrs[5] = baud # ispeed, ospeed
+    termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    return fd
+
+
+# ==================== MAIN
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bake_agent.py",
+                description="Answers REQUEST frames from the host over the serial console or a socket")
+    transport = parser.add_mutually_exclusive_group(required=True)
+    transport.add_argument("--serial", help="serial device to listen on, e.g. /dev/serial0")
+    transport.add_argument("--tcp", type=int, help="TCP port to listen on")
+    parser.add_argument("--bind", default="127.0.0.1",
+                        help="address for --tcp to listen on (default localhost only)")
+    args = parser.parse_args()
+
+    if args.serial:
+        fd = openSerial(args.serial)
+        serve(lambda: os.read(fd, 4096), lambda b: os.write(fd, b))
+    else:
+        server = socket.create_server((args.bind, args.tcp))
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                try:
+                    serve(lambda: conn.recv(4096), conn.sendall)
+                except OSError:
+                    pass # host went away, wait for the next one
@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+# Framed, machine-readable results for on-target helpers
+#
+# A frame is a single ASCII line:
+#     @@BAKE|<seq>|<STEP>|<STATUS>|<payload>|<crc32>@@
+#
+# - seq:     counts up from 0 for each writer (so the host can spot drops)
+# - STEP:    which helper / step this is about (GEN_CONFIG, STRESS, ...)
+# - STATUS:  SUCCESS / FAIL are final, PROGRESS / HEARTBEAT are not,
+#            REQUEST is the host asking bake_agent.py to do something
+# - payload: urlencoded key=value pairs (so it never contains '|' or '@')
+# - crc32:   8 hex digits over everything between the markers (minus the crc)
+#
+# The host feeds raw serial bytes into a FrameParser as they arrive, so frames
+# get picked out even if kernel messages get splattered into the console.
+# Frames that get corrupted fail the checksum and are dropped. Final frames
+# (SUCCESS / FAIL) get sent FINAL_REPEATS times, byte for byte the same, so a
+# kernel message landing in the middle of one doesn't lose the result; the
+# host ignores the extra copies.
+#
+# From a shell script:
+#     python3 bake_frame.py CHECKLOGIN SUCCESS msg="logged in"
+
+import sys
+import zlib
+import urllib.parse
+
+START = b"@@BAKE|"
+END = b"@@"
+MAX_FRAME = 4096 # bytes; anything longer than this without an END is junk
+FINAL_REPEATS = 3
+
+SUCCESS = "SUCCESS"
+FAIL = "FAIL"
+PROGRESS = "PROGRESS"
+HEARTBEAT = "HEARTBEAT"
+REQUEST = "REQUEST"
+STATUSES = (SUCCESS, FAIL, PROGRESS, HEARTBEAT, REQUEST)
+
+
+def _crc(body):
+    return f"{zlib.crc32(body.encode('ascii')) & 0xffffffff:08x}"
+
+
+class Frame:
+    def __init__(self, seq, step, status, data=None):
+        self.seq = seq
+        self.step = step
+        self.status = status
+        self.data = dict(data or {})
+
+    @property
+    def ok(self):
+        return self.status == SUCCESS
+
+    @property
+    def final(self):
+        " SUCCESS or FAIL: the helper is done talking about this step "
+        return self.status in (SUCCESS, FAIL)
+
+    def get(self, key, default=None, type=str):
+        " Payload values are all strings on the wire, convert on the way out "
+        if key not in self.data:
+            return default
+        try:
+            return type(self.data[key])
+        except ValueError:
+            return default
+
+    def _body(self):
+        payload = urllib.parse.urlencode(self.data)
+        return f"{self.seq}|{self.step}|{self.status}|{payload}"
+
+    def encode(self):
+        body = self._body()
+        return f"{START.decode()}{body}|{_crc(body)}{END.decode()}"
+
+    def __repr__(self):
+        return f"<Frame #{self.seq} {self.step}|{self.status} {self.data}>"
+
+    def __str__(self):
+        return f"FRAME #{self.seq} {self.step}|{self.status} {self.data}"
+
+
+def decode(body):
+    """ Decodes the bytes between START and END into a Frame
+    Returns None if the frame is malformed or the checksum doesn't match"""
+    try:
+        body = body.decode("ascii")
+        fields = body.split("|")
+        if len(fields) != 5:
+            return None
+        seq, step, status, payload, crc = fields
+        if _crc("|".join(fields[:4])) != crc:
+            return None
+        if status not in STATUSES or not step:
+            return None
+        data = dict(urllib.parse.parse_qsl(payload, keep_blank_values=True))
+        return Frame(int(seq), step, status, data)
+    except (UnicodeDecodeError, ValueError):
+        return None
+
+
+class FrameParser:
+    """ Incremental parser: feed it bytes as they come off the wire,
+    get back whatever complete frames showed up """
+
+    def __init__(self):
+        self.buf = b""
+        self.badFrames = 0
+
+    def feed(self, data):
+        self.buf += data
+        frames = []
+
+        while True:
+            start = self.buf.find(START)
+            if start < 0:
+                # Keep a tail in case the START marker got split across reads
+                self.buf = self.buf[-(len(START) - 1):]
+                return frames
+
+            self.buf = self.buf[start:]
+            end = self.buf.find(END, len(START))
+            if end < 0:
+                if len(self.buf) > MAX_FRAME:
+                    self.badFrames += 1
+                    self.buf = self.buf[len(START):] # Never closed: skip it
+                return frames
+
+            if self.buf.startswith(START, end):
+                # A new frame started before this one ended: it got cut off
+                self.badFrames += 1
+                self.buf = self.buf[end:]
+                continue
+            body = self.buf[len(START):end]
+            frame = decode(body)
+            if frame is None and end + len(END) == len(self.buf):
+                # Could be a cut-off frame followed by the first half of a
+                # new START marker: wait for more bytes before deciding
+                return frames
+
+            self.buf = self.buf[end + len(END):]
+            if frame is None:
+                self.badFrames += 1
+            else:
+                frames.append(frame)
+
+
+class FrameWriter:
+    " Used by helpers on the pi to send frames back up the console "
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+        self.seq = 0
+
+    def emit(self, step, status, **data):
+        assert status in STATUSES, f"bad frame status {status}"
+        frame = Frame(self.seq, step, status, {k: str(v) for k, v in data.items()})
+        self.seq += 1
+        # Start on a fresh line, so half-printed output doesn't get glued on
+        for _ in range(FINAL_REPEATS if frame.final else 1):
+            self.out.write("\n" + frame.encode() + "\n")
+            self.out.flush()
+        return frame
+
+
+# ==================== MAIN
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: bake_frame.py STEP STATUS [key=value ...]")
+        raise SystemExit(1)
+
+    step, status = sys.argv[1], sys.argv[2]
+    if status not in STATUSES:
+        print(f"Error: status must be one of {', '.join(STATUSES)}")
+        raise SystemExit(1)
+
+    data = dict(arg.split("=", 1) for arg in sys.argv[3:] if "=" in arg)
+    FrameWriter().emit(step, status, **data)
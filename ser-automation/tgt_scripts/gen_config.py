@@ -1,14 +1,26 @@
 # Used to set up the next configuration to test
 
+import os
 import sys
 import argparse
 from enum import Enum
 
+import bake_frame
+import tryboot_render
+
+# Templates live next to this script (so it works from any directory)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class ConfigError(Exception):
+    " Bad config id / run number / template. The CLI turns it into a FAIL frame "
 
 def err(msg):
     print(f"Error: {str(msg)}")
 def err_exit(msg, code=1):
+    " CLI only: library code raises ConfigError, so importers don't get stray frames "
     err(msg)
+    bake_frame.FrameWriter().emit("GEN_CONFIG", bake_frame.FAIL, msg=msg)
     raise SystemExit(code) from None # needed to exit from inside exception handlers
 
 #print(f"Got arg {args.config_id}")
@@ -58,10 +70,10 @@ class Config:
         self.id = id
 
         if id not in configs:
-            err_exit(f"Config {id} not recognized")
+            raise ConfigError(f"Config {id} not recognized")
 
         _conf = configs[id]
-        self.template_file = _conf['_template']
+        self.template_file = os.path.join(SCRIPT_DIR, _conf['_template'])
 
         self.varType, self.varObj = _conf["_vars"]
         if not isinstance(self.varType, CT):
@@ -73,12 +85,12 @@ class Config:
             with open(self.template_file) as f:
                 self.template_str = f.read()
         except IOError as e:
-            err_exit(f"I/O error: {e}")
+            raise ConfigError(f"I/O error: {e}") from None
         except Exception as e: #handle other exceptions such as attribute errors
-            err_exit("Unexpected error:", e)
+            raise ConfigError(f"Unexpected error: {e}") from None
 
         if not self.template_str:
-            err_exit(f"Template file {self.template_file} is empty")
+            raise ConfigError(f"Template file {self.template_file} is empty")
 
     def numRuns(self):
         if self.varType == CT.STATIC:
@@ -87,7 +99,7 @@ class Config:
             confs = self.varObj()
             return len(confs)
         else:
-            err_exit(f"ASSERT FAILED: unexpected config tpe {self.varType}");
+            raise ConfigError(f"ASSERT FAILED: unexpected config tpe {self.varType}")
 
     def getAllVars(self):
         if self.varType == CT.STATIC:
@@ -95,7 +107,7 @@ class Config:
         elif self.varType == CT.FUNC:
             return self.varObj()
         else:
-            err_exit(f"ASSERT FAILED: unexpected config tpe {self.varType}");
+            raise ConfigError(f"ASSERT FAILED: unexpected config tpe {self.varType}")
 
     def genConf(self, n):
         " Gen the config file for run n"
@@ -103,22 +115,34 @@ class Config:
         allVars = self.getAllVars()
         try:
             currVars = allVars[n]
-        except Exception as e:
-            print(repr(e))
-            err_exit(f"Invalid run #{n}, config '{self.id}' only goes up to n={len(allVars)-1}")
+        except IndexError:
+            raise ConfigError(f"Invalid run #{n}, config '{self.id}' only goes up to n={len(allVars)-1}") from None
 
         try:
-            result = self.template_str.format_map(currVars)
-        except ValueError as e:
-            err_exit("Template contains positional field (e.g. {})")
-        except KeyError as e:
-            err_exit(f"Template contains unexpected variable {e.args[0]}")
+            result = tryboot_render.render(self.template_str, currVars)
+        except tryboot_render.RenderError as e:
+            raise ConfigError(str(e)) from None
         return result
 
 
 
 
 
+def sweepSpace(conf_id):
+    """ All the var dicts for conf_id (without loading the template), or [] if
+    there's no such config. Used on the host to work out what runs tested """
+    if conf_id not in configs:
+        return []
+    varType, varObj = configs[conf_id]["_vars"]
+    return [varObj] if varType == CT.STATIC else varObj()
+
+def getVars(conf_id, n):
+    " The variables for run n of conf_id, or None if there's no such run "
+    allVars = sweepSpace(conf_id)
+    if not 0 <= n < len(allVars):
+        return None
+    return allVars[n]
+
 def listConfs():
     print("Listing Configs:")
     for conf_id in configs.keys():
@@ -126,20 +150,6 @@ def listConfs():
         n = conf.numRuns()
         print(f" {conf_id} : 0-{n-1}")
 
-# ==================== MAIN
-
-parser = argparse.ArgumentParser(prog="gen_config.py",
-            description="""Generates config files for automated stress testing:
-there's different kinds of configs (specified as a dictionary in the source.
-Each config has a string id, and generates 1 or more runs
-
-    `gen_config.py CONFIG_ID N --out outfile.txt /boot/firmware/tryboot.txt`
-
-You should run gen_config once for N ranging from 0 to $MAX_N
-To check how many runs you should do for each config
-    `gen_config.py --list`
-                                 """)
-
 # Weird hack to allow --list with no other args
 # Returns an Action that calls the function, then exits
 def OverrideArg(func):
@@ -150,47 +160,81 @@ def OverrideArg(func):
     return Override
 
 
-# This overrides normal arg parsing, prints confs, and exits
-parser.add_argument("-l", "--list", nargs=0, action=OverrideArg(listConfs),  help="list number of configs")
-
-parser.add_argument("config_id", help="which config to run")
-parser.add_argument("n",   help="start the nth run for config_id", type=int)
-parser.add_argument("-o", "--outfile",  help="path to write config file out to", required=True)
-args = parser.parse_args()
-
-
-# Will error out if goes wrong
-conf = Config(args.config_id)
-
-
-
-# Loaded template file
-#print("\n=====\n" +template_str + "\n=======\n")#DEBUG
-
-
-#class VarDict(dict):
-#    """We want to override the default dict to make sure all variables are used"""
-#    def __init__(self, varsObj):
-#        self.update(**varsObj)
-#        self.varsUsed = { k:0 for k in varsObj.keys()}
-#
-#    def __getitem__(self, key):
-#        print(f"Accessed key {key}")
-#        self.varsUsed[key] += 1
-#        return super().__getitem__(key);
-#
-#v = VarDict(conf["_vars"])
+# ==================== MAIN
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="gen_config.py",
+                description="""Generates config files for automated stress testing:
+there's different kinds of configs (specified as a dictionary in the source.
+Each config has a string id, and generates 1 or more runs
 
-#print(conf.genConf(args.n))
+    `gen_config.py CONFIG_ID N --out outfile.txt`
+    `sudo gen_config.py CONFIG_ID N --install`   (straight to /boot/firmware/tryboot.txt,
+                                                skipped if it's already identical)
 
-print(f"Writing to {args.outfile}")
-try:
-    with open(args.outfile, "w") as out:
-        out.write(conf.genConf(args.n))
-except IOError as e:
-    err_exit(f"I/O error: {e}")
-except Exception as e: #handle other exceptions such as attribute errors
-    err_exit("Unexpected error:", e)
+You should run gen_config once for N ranging from 0 to $MAX_N
+To check how many runs you should do for each config
+    `gen_config.py --list`
+                                 """)
 
-print(f"BAKE-STEP|GEN_CONFIG|SUCCESS| wrote conf '{args.config_id} {args.n}' to {args.outfile}")
+    # This overrides normal arg parsing, prints confs, and exits
+    parser.add_argument("-l", "--list", nargs=0, action=OverrideArg(listConfs),  help="list number of configs")
+
+    parser.add_argument("config_id", help="which config to run")
+    parser.add_argument("n",   help="start the nth run for config_id", type=int)
+    parser.add_argument("-o", "--outfile",  help="path to write config file out to")
+    parser.add_argument("-i", "--install", nargs="?", const=tryboot_render.TRYBOOT_PATH, metavar="DEST",
+                        help=f"install the config (default {tryboot_render.TRYBOOT_PATH}), skipped if unchanged")
+    args = parser.parse_args()
+    if not args.outfile and not args.install:
+        parser.error("one of --outfile or --install is required")
+
+
+    # Will error out if goes wrong
+    try:
+        conf = Config(args.config_id)
+        content = conf.genConf(args.n)
+    except ConfigError as e:
+        err_exit(str(e))
+
+
+
+    # Loaded template file
+    #print("\n=====\n" +template_str + "\n=======\n")#DEBUG
+
+
+    #class VarDict(dict):
+    #    """We want to override the default dict to make sure all variables are used"""
+    #    def __init__(self, varsObj):
+    #        self.update(**varsObj)
+    #        self.varsUsed = { k:0 for k in varsObj.keys()}
+    #
+    #    def __getitem__(self, key):
+    #        print(f"Accessed key {key}")
+    #        self.varsUsed[key] += 1
+    #        return super().__getitem__(key);
+    #
+    #v = VarDict(conf["_vars"])
+
+
+    #print(conf.genConf(args.n))
+
+    changed = None
+    try:
+        if args.outfile:
+            print(f"Writing to {args.outfile}")
+            with open(args.outfile, "w") as out:
+                out.write(content)
+        if args.install:
+            changed, _ = tryboot_render.install(content, args.install)
+            print(f"{'Installed' if changed else 'Already up to date:'} {args.install}")
+    except IOError as e:
+        err_exit(f"I/O error: {e}")
+    except Exception as e: #handle other exceptions such as attribute errors
+        err_exit("Unexpected error:", e)
+
+    bake_frame.FrameWriter().emit("GEN_CONFIG", bake_frame.SUCCESS,
+            config_id=args.config_id, n=args.n, outfile=args.outfile or args.install,
+            hash=tryboot_render.contentHash(content)[:16],
+            changed="" if changed is None else int(changed),
+            **conf.getAllVars()[args.n])
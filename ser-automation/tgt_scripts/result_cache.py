@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+# Remembers stress results across sessions, so repeat campaigns don't re-test
+# points we already know the answer to
+#
+# Results are keyed by (board, sha256 of the rendered tryboot.txt, stress
+# method, stress duration): the same config on the same board under the same
+# stress is the same experiment, whichever sweep or script asked for it.
+# Each result is one JSON line, appended as runs finish.
+#
+# A point is established once the Wilson interval on its pass rate is clear of
+# 50% (at 90% confidence: 3 clean passes, or 3 clean fails), and runners skip
+# established points. Results stop counting when:
+# - they came from different firmware (--firmware, e.g. `vcgencmd version` hash)
+# - the ambient temperature differs by more than --ambient-tol degrees
+# (with either filter set, results that weren't tagged with it don't count)
+# - they're older than --since
+#
+#     result_cache.py show [--board pi1]
+#     result_cache.py forget --board pi1 [--hash 3f2a...] [--before 2026-01-01]
+
+import argparse
+import datetime
+import json
+import math
+import os
+import time
+
+CACHE_NAME = "result_cache.jsonl"
+Z_90 = 1.645        # one-sided 90%
+ESTABLISHED = 0.5   # interval has to be all above (or all below) this pass rate
+AMBIENT_TOL = 5.0   # degrees C
+
+
+def pointKey(board, confHash, method, duration):
+    return f"{board}|{confHash[:16]}|{method}|{duration}"
+
+
+def wilson(passes, n, z=Z_90):
+    " (low, high) bounds on the pass rate, (0, 1) when we know nothing "
+    if n == 0:
+        return 0.0, 1.0
+    p = passes / n
+    center = p + z * z / (2 * n)
+    spread = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+    denom = 1 + z * z / n
+    return max(0.0, (center - spread) / denom), min(1.0, (center + spread) / denom)
+
+
+def parseDate(s):
+    " 2026-01-01 or 2026-01-01T12:00:00 as an epoch "
+    return datetime.datetime.fromisoformat(s).timestamp()
+
+
+class ResultCache:
+    def __init__(self, path, firmware=None, ambient=None, ambientTol=AMBIENT_TOL, since=None):
+        self.path = path
+        self.firmware = firmware
+        self.ambient = ambient
+        self.ambientTol = ambientTol
+        self.since = since
+        self.records = []
+        self.load()
+
+    def load(self):
+        self.records = []
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    self.records.append(json.loads(line))
+                except ValueError:
+                    pass # half-written line from a pi that lost power
+
+    def counts(self, rec):
+        " Does this record still count, given the invalidation knobs? "
+        if self.since is not None and rec["time"] < self.since:
+            return False
+        # Untagged results could have come from anything: they don't match a filter
+        if self.firmware and rec.get("firmware") != self.firmware:
+            return False
+        if self.ambient is not None:
+            if rec.get("ambient") is None or abs(rec["ambient"] - self.ambient) > self.ambientTol:
+                return False
+        return True
+
+    def record(self, board, confHash, method, duration, passed, **meta):
+        rec = dict(meta, key=pointKey(board, confHash, method, duration), board=board,
+                   hash=confHash[:16], method=method, duration=duration,
+                   passed=bool(passed), time=time.time(),
+                   firmware=self.firmware, ambient=self.ambient)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(rec) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.records.append(rec)
+        return rec
+
+    def stats(self, key):
+        " (passes, fails, (low, high)) for a point, from the records that still count "
+        results = [r["passed"] for r in self.records if r["key"] == key and self.counts(r)]
+        passes = sum(results)
+        return passes, len(results) - passes, wilson(passes, len(results))
+
+    def verdict(self, board, confHash, method, duration):
+        " True / False if the point's established as passing / failing, None if we should test it "
+        _, _, (low, high) = self.stats(pointKey(board, confHash, method, duration))
+        if low > ESTABLISHED:
+            return True
+        if high < ESTABLISHED:
+            return False
+        return None
+
+    def forget(self, board=None, confHash=None, before=None):
+        " Drops matching records for good (rewrites the file), returns how many "
+        def matches(rec):
+            return ((board is None or rec["board"] == board) and
+                    (confHash is None or rec["hash"].startswith(confHash[:16])) and
+                    (before is None or rec["time"] < before))
+        keep = [r for r in self.records if not matches(r)]
+        dropped = len(self.records) - len(keep)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            for rec in keep:
+                f.write(json.dumps(rec) + "\n")
+        os.replace(tmp, self.path)
+        self.records = keep
+        return dropped
+
+    def points(self, board=None):
+        " {key: (passes, fails, (low, high))} for every point we have results for "
+        keys = sorted({r["key"] for r in self.records if board is None or r["board"] == board})
+        return {key: self.stats(key) for key in keys}
+
+
+def addArgs(parser):
+    " The invalidation knobs, for runners that use the cache "
+    parser.add_argument("--no-cache", action="store_true", help="don't skip points, even established ones")
+    parser.add_argument("--firmware", help="only trust cached results from this firmware")
+    parser.add_argument("--ambient", type=float, help="ambient temp (C): only trust results from similar temps")
+    parser.add_argument("--ambient-tol", type=float, default=AMBIENT_TOL)
+    parser.add_argument("--since", type=parseDate, help="ignore cached results from before this date")
+
+
+def fromArgs(args, path):
+    return ResultCache(path, args.firmware, args.ambient, args.ambient_tol, args.since)
+
+
+# ==================== MAIN
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="result_cache.py",
+                description="Inspect or prune the cross-session stress result cache")
+    parser.add_argument("--cache", default=CACHE_NAME, help="cache file")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_show = sub.add_parser("show", help="per-point pass/fail counts and confidence")
+    p_show.add_argument("--board")
+    addArgs(p_show)
+
+    p_forget = sub.add_parser("forget", help="drop cached results (e.g. after a hardware change)")
+    p_forget.add_argument("--board")
+    p_forget.add_argument("--hash", help="rendered config hash (prefix is fine)")
+    p_forget.add_argument("--before", type=parseDate, help="only results from before this date")
+
+    args = parser.parse_args()
+
+    if args.cmd == "show":
+        cache = fromArgs(args, args.cache)
+        print(f"{'board':>14} {'config hash':>16} {'stress':>18} {'pass':>5} {'fail':>5} {'interval':>12}  verdict")
+        for key, (passes, fails, (low, high)) in cache.points(args.board).items():
+            board, confHash, method, duration = key.split("|")
+            verdict = "PASS" if low > ESTABLISHED else "FAIL" if high < ESTABLISHED else "-"
+            print(f"{board:>14} {confHash:>16} {method + ' ' + duration:>18} {passes:>5} {fails:>5}"
+                  f"  {low:.2f}-{high:.2f}  {verdict}")
+    else:
+        if args.board is None and args.hash is None and args.before is None:
+            parser.error("forget needs at least one of --board, --hash, --before")
+        cache = ResultCache(args.cache)
+        print(f"Forgot {cache.forget(args.board, args.hash, args.before)} results")
@@ -1,4 +1,3 @@
 #!/bin/bash
 #this one is very simple, just make sure we can run something
-echo 'BAKE-STEP|CHECKLOGIN|SUCCESS|logged in'
-
+python3 "$(dirname "$0")/bake_frame.py" CHECKLOGIN SUCCESS msg="logged in"
@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+# Runs the stress test on the pi, reporting back with bake_frame frames:
+# - a HEARTBEAT every few seconds while stress is running (so the host can
+#   tell a hung board from a slow one)
+# - a PROGRESS frame after each iteration
+# - a final SUCCESS / FAIL frame with how long we survived
+#
+#     python3 step_stress.py --iters 4 --time 30
+
+import argparse
+import subprocess
+import time
+
+import bake_frame
+
+STEP = "STRESS"
+THERMAL_PATH = "/sys/class/thermal/thermal_zone0/temp"
+
+
+def readTemp():
+    " Core temp in C, or None (cheaper than shelling out to vcgencmd) "
+    try:
+        with open(THERMAL_PATH) as f:
+            return int(f.read().strip()) / 1000
+    except (OSError, ValueError):
+        return None
+
+
+def runStress(writer, iters=4, duration=30, beat=5):
+    """ Runs `iters` rounds of `stress -c 4 -t duration`, emitting frames on writer
+    Returns the final frame """
+    start = time.time()
+
+    for i in range(iters):
+        cmd = ["stress", "-c", "4", "-t", str(duration)]
+        try:
+            proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            return writer.emit(STEP, bake_frame.FAIL, iter=i,
+                               survived=int(time.time() - start), msg=f"couldn't start stress: {e}")
+
+        while True:
+            try:
+                code = proc.wait(timeout=beat)
+                break
+            except subprocess.TimeoutExpired:
+                writer.emit(STEP, bake_frame.HEARTBEAT, iter=i,
+                            elapsed=int(time.time() - start), temp=readTemp())
+
+        if code != 0:
+            return writer.emit(STEP, bake_frame.FAIL, iter=i,
+                               survived=int(time.time() - start), msg=f"stress exited with {code}")
+
+        writer.emit(STEP, bake_frame.PROGRESS, iter=i, iters=iters,
+                    elapsed=int(time.time() - start))
+
+    return writer.emit(STEP, bake_frame.SUCCESS, iters=iters,
+                       survived=duration * iters, msg=f"ran {iters} iterations of stress")
+
+
+# ==================== MAIN
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="step_stress.py",
+                description="Runs stress, reporting progress as BAKE frames")
+    parser.add_argument("--iters", help="number of stress runs", type=int, default=4)
+    parser.add_argument("--time", help="seconds per stress run", type=int, default=30)
+    parser.add_argument("--beat", help="seconds between heartbeat frames", type=int, default=5)
+    args = parser.parse_args()
+
+    final = runStress(bake_frame.FrameWriter(), args.iters, args.time, args.beat)
+    raise SystemExit(0 if final.ok else 1)
@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+# The one place that renders and writes tryboot.txt
+#
+# Used by gen_config.py, testing/probe/eb_probe.py and
+# experiments/change_undervolt.sh. Handles all three template styles:
+# - {VOLTAGE}       (gen_config templates, format_map)
+# - <voltage>       (eb_probe template, plain substitution)
+# - extra lines     (change_undervolt.sh appends over_voltage=... lines)
+#
+# install() skips the write if the target already has the same content (saves
+# SD card writes), otherwise it writes a temp file, fsyncs, and renames it over
+# the target so a power cut mid-write can't leave a half-written tryboot.txt.
+#
+#     tryboot_render.py render TEMPLATE [-s VOLTAGE=-2] [-a over_voltage=-2] -o OUT
+#     sudo tryboot_render.py install RENDERED [--dest /boot/firmware/tryboot.txt]
+
+import argparse
+import hashlib
+import os
+import sys
+
+TRYBOOT_PATH = "/boot/firmware/tryboot.txt"
+
+
+class RenderError(Exception):
+    pass
+
+
+def render(template_str, variables=None, append=None):
+    """ Fills in {NAME} and <name> placeholders from variables, then appends
+    `append` (a list of "key=value" lines) at the end """
+    variables = variables or {}
+    result = template_str
+
+    # <name> style: only touch names we were given, so other <...> text survives
+    for key, val in variables.items():
+        result = result.replace(f"<{key.lower()}>", str(val))
+
+    if "{" in result:
+        try:
+            result = result.format_map(variables)
+        except ValueError:
+            raise RenderError("Template contains positional field (e.g. {})")
+        except KeyError as e:
+            raise RenderError(f"Template contains unexpected variable {e.args[0]}")
+
+    for line in append or []:
+        if not result.endswith("\n"):
+            result += "\n"
+        result += line + "\n"
+    return result
+
+
+def renderFile(template_path, variables=None, append=None):
+    with open(template_path) as f:
+        template_str = f.read()
+    if not template_str:
+        raise RenderError(f"Template file {template_path} is empty")
+    return render(template_str, variables, append)
+
+
+def contentHash(content):
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def fileHash(path):
+    " sha256 of the file at path, or None if it doesn't exist "
+    try:
+        with open(path, "rb") as f:
+            return contentHash(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def install(content, dest=TRYBOOT_PATH):
+    """ Writes content to dest, unless it's already there
+    Returns (changed, hash) """
+    digest = contentHash(content)
+    if fileHash(dest) == digest:
+        return (False, digest)
+
+    tmp = f"{dest}.tmp"
+    with open(tmp, "w") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, dest)
+
+    # Make the rename itself stick too
+    dirfd = os.open(os.path.dirname(os.path.abspath(dest)), os.O_RDONLY)
+    try:
+        os.fsync(dirfd)
+    except OSError:
+        pass # some filesystems (e.g. vfat) won't fsync a directory
+    finally:
+        os.close(dirfd)
+    return (True, digest)
+
+
+def parseAssignments(pairs):
+    " ['A=1', 'B=x'] -> {'A': '1', 'B': 'x'} "
+    out = {}
+    for pair in pairs or []:
+        if "=" not in pair:
+            raise RenderError(f"Expected NAME=VALUE, got '{pair}'")
+        key, val = pair.split("=", 1)
+        out[key] = val
+    return out
+
+
+# ==================== MAIN
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="tryboot_render.py",
+                description="Renders tryboot.txt from a template, and installs it (only if it changed)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_render = sub.add_parser("render", help="fill in a template")
+    p_render.add_argument("template")
+    p_render.add_argument("-s", "--set", action="append", help="NAME=VALUE for {NAME} / <name>")
+    p_render.add_argument("-a", "--append", action="append", help="extra line to add at the end")
+    p_render.add_argument("-o", "--outfile", help="write here instead of stdout")
+
+    p_install = sub.add_parser("install", help="install a rendered file (skipped if unchanged)")
+    p_install.add_argument("rendered")
+    p_install.add_argument("--dest", default=TRYBOOT_PATH)
+
+    args = parser.parse_args()
+
+    try:
+        if args.cmd == "render":
+            content = renderFile(args.template, parseAssignments(args.set), args.append)
+            if args.outfile:
+                with open(args.outfile, "w") as f:
+                    f.write(content)
+            else:
+                sys.stdout.write(content)
+        else:
+            with open(args.rendered) as f:
+                changed, digest = install(f.read(), args.dest)
+            print(f"{'Wrote' if changed else 'Unchanged, skipped'} {args.dest} (sha256 {digest[:12]})")
+    except (RenderError, OSError) as e:
+        print(f"Error: {e}")
+        raise SystemExit(1)
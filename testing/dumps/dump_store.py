@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+# Deduplicating core dump store
+#
+# Most undervolt crashes are the same fault over and over, and each one used to
+# leave a full uncompressed core on the SD card. Instead, the kernel pipes the
+# dump into this script (see enable_core_dump.sh):
+#     kernel.core_pattern=|/home/baking/easy_bake/testing/dumps/dump_store.py ingest --exe %e --time %t --signal %s
+#
+# which gzips it as it streams in, works out a crash signature from the ELF
+# notes at the front of the dump (exe, signal, faulting PC and LR as
+# module+offset, so ASLR doesn't make every crash look new), and only keeps
+# the first --keep dumps of each signature. index.json keeps, per signature:
+# count, boards, over_voltage settings, first/last seen, and the kept samples.
+# Counts are kept per store (each pi's store has its own id), so merging the
+# same pi's store into the fleet store again replaces its counts instead of
+# adding them twice.
+#
+#     dump_store.py ingest core.stress-ng.1234.1700000000 --delete   # old raw dumps
+#     dump_store.py list
+#     dump_store.py merge dumps/pi1 dumps/pi2 --store dumps/fleet      # on the host
+#     dump_store.py triage --store dumps/fleet                         # gdb bt per signature
+
+import argparse
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+STORE_DIR = "/home/baking/dumps"
+CHUNK = 1 << 20
+MAX_HEAD = 32 << 20 # never buffer more than this looking for the notes
+
+PT_NOTE = 4
+NT_PRSTATUS = 1
+NT_FILE = 0x46494c45
+
+EM_ARM = 40
+EM_AARCH64 = 183
+EM_X86_64 = 62
+
+# Where pr_reg starts in elf_prstatus, and which regs are (pc, lr) for each arch
+PRSTATUS_REGS = {
+    EM_AARCH64: (112, "<34Q", 32, 30),  # x0-x30, sp, pc, pstate
+    EM_ARM: (72, "<18I", 15, 14),       # r0-r15, cpsr, orig_r0
+    EM_X86_64: (112, "<27Q", 16, None), # rip, no link register
+}
+
+
+# ============= ELF core parsing
+
+def _phdrs(head):
+    " [(p_type, p_offset, p_filesz)], or None if head doesn't reach the end of the phdrs yet "
+    if len(head) < 64 or head[:4] != b"\x7fELF":
+        return None
+    is64 = head[4] == 2
+    if is64:
+        phoff, = struct.unpack_from("<Q", head, 32)
+        phentsize, phnum = struct.unpack_from("<HH", head, 54)
+    else:
+        phoff, = struct.unpack_from("<I", head, 28)
+        phentsize, phnum = struct.unpack_from("<HH", head, 42)
+    if len(head) < phoff + phentsize * phnum:
+        return None
+
+    phdrs = []
+    for i in range(phnum):
+        off = phoff + i * phentsize
+        if is64:
+            p_type, _, p_offset, _, _, p_filesz = struct.unpack_from("<IIQQQQ", head, off)
+        else:
+            p_type, p_offset, _, _, p_filesz = struct.unpack_from("<IIIII", head, off)
+        phdrs.append((p_type, p_offset, p_filesz))
+    return phdrs
+
+
+def _notes_end(head):
+    " How much of the dump we need to see all the notes, or None if we can't tell yet "
+    phdrs = _phdrs(head)
+    if phdrs is None:
+        return None
+    return max([p_offset + p_filesz for p_type, p_offset, p_filesz in phdrs if p_type == PT_NOTE],
+               default=64)
+
+
+def _iter_notes(head):
+    for p_type, p_offset, p_filesz in _phdrs(head):
+        if p_type != PT_NOTE:
+            continue
+        pos, end = p_offset, min(p_offset + p_filesz, len(head))
+        while pos + 12 <= end:
+            namesz, descsz, ntype = struct.unpack_from("<III", head, pos)
+            pos += 12 + ((namesz + 3) & ~3)
+            yield ntype, head[pos:pos + descsz]
+            pos += (descsz + 3) & ~3
+
+
+def _parse_nt_file(desc, is64):
+    " [(start, end, file offset, path)] from an NT_FILE note "
+    word = "Q" if is64 else "I"
+    size = struct.calcsize(word)
+    count, page_size = struct.unpack_from(f"<{word}{word}", desc, 0)
+    triples = struct.unpack_from(f"<{3 * count}{word}", desc, 2 * size)
+    names = desc[(2 + 3 * count) * size:].split(b"\0")
+    return [(triples[3 * i], triples[3 * i + 1], triples[3 * i + 2] * page_size,
+             names[i].decode(errors="replace")) for i in range(count)]
+
+
+def locate(addr, mappings):
+    " An address as module+offset, which stays the same across runs despite ASLR "
+    if addr is None:
+        return None
+    for start, end, file_ofs, path in mappings:
+        if start <= addr < end:
+            return f"{os.path.basename(path)}+{addr - start + file_ofs:#x}"
+    return f"{addr:#x}"
+
+
+def parse_core(head):
+    """ Pulls what we need for the signature out of the start of a core dump:
+    {machine, signal, pc, lr, exe_path}, or None if it isn't an ELF core """
+    if _notes_end(head) is None:
+        return None
+    is64 = head[4] == 2
+    machine, = struct.unpack_from("<H", head, 18)
+    info = {"machine": machine, "signal": None, "pc": None, "lr": None, "exe_path": None}
+    regs, mappings = None, []
+
+    for ntype, desc in _iter_notes(head):
+        # The first PRSTATUS is the thread that took the signal
+        if ntype == NT_PRSTATUS and regs is None and machine in PRSTATUS_REGS:
+            offset, fmt, pc_i, lr_i = PRSTATUS_REGS[machine]
+            if len(desc) >= offset + struct.calcsize(fmt):
+                info["signal"], = struct.unpack_from("<h", desc, 12)
+                regs = struct.unpack_from(fmt, desc, offset)
+                info["pc"] = regs[pc_i]
+                info["lr"] = regs[lr_i] if lr_i is not None else None
+        elif ntype == NT_FILE:
+            try:
+                mappings = _parse_nt_file(desc, is64)
+            except struct.error:
+                pass
+
+    if mappings:
+        info["exe_path"] = mappings[0][3] # the executable gets mapped first
+    info["pc_loc"] = locate(info["pc"], mappings)
+    # On arm the LR is the caller's return address: a one-frame backtrace for free
+    info["lr_loc"] = locate(info["lr"], mappings)
+    return info
+
+
+def signature(exe, info):
+    " Same crash, same signature, whichever board / pid / address layout it came from "
+    key = f"{exe}|{info.get('signal')}|{info.get('pc_loc')}|{info.get('lr_loc')}"
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+# ============= index
+
+class Index:
+    " index.json in a store directory, locked while we read-modify-write it "
+
+    def __init__(self, store):
+        self.store = store
+        self.path = os.path.join(store, "index.json")
+        self.data = {"signatures": {}}
+        self._lock = None
+
+    def __enter__(self):
+        os.makedirs(os.path.join(self.store, "objects"), exist_ok=True)
+        self._lock = open(os.path.join(self.store, "index.lock"), "w")
+        fcntl.flock(self._lock, fcntl.LOCK_EX)
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.data = json.load(f)
+        self.data.setdefault("store_id", f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}")
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.data, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        fcntl.flock(self._lock, fcntl.LOCK_UN)
+        self._lock.close()
+
+    @property
+    def sigs(self):
+        return self.data["signatures"]
+
+    @property
+    def id(self):
+        return self.data["store_id"]
+
+    def sources(self, entry, store_id=None):
+        " Per-store counts for an entry (older indexes only had the totals: those are ours) "
+        if "sources" not in entry:
+            entry["sources"] = {store_id or self.id: {k: entry[k] for k in
+                                ("count", "boards", "voltages", "first", "last")}}
+        return entry["sources"]
+
+    def wants_sample(self, sig, keep):
+        return len(self.sigs.get(sig, {}).get("samples", [])) < keep
+
+    def record(self, sig, crash, count=1):
+        entry = self.sigs.setdefault(sig, {
+            "exe": crash["exe"], "exe_path": crash.get("exe_path"), "signal": crash.get("signal"),
+            "pc": crash.get("pc_loc"), "lr": crash.get("lr_loc"), "samples": [], "sources": {},
+        })
+        own = self.sources(entry).setdefault(self.id, {
+            "count": 0, "boards": {}, "voltages": {}, "first": crash["time"], "last": crash["time"]})
+        own["count"] += count
+        for key, val in (("boards", crash.get("board")), ("voltages", crash.get("voltage"))):
+            val = str(val)
+            own[key][val] = own[key].get(val, 0) + count
+        own["first"] = min(own["first"], crash["time"])
+        own["last"] = max(own["last"], crash["time"])
+        totals(entry)
+        return entry
+
+
+def totals(entry):
+    " Recomputes an entry's count / boards / voltages / first / last from its sources "
+    parts = entry["sources"].values()
+    entry["count"] = sum(p["count"] for p in parts)
+    for key in ("boards", "voltages"):
+        entry[key] = {}
+        for p in parts:
+            for val, n in p[key].items():
+                entry[key][val] = entry[key].get(val, 0) + n
+    entry["first"] = min(p["first"] for p in parts)
+    entry["last"] = max(p["last"] for p in parts)
+
+
+# ============= ingest
+
+def vcgencmd(*args):
+    try:
+        out = subprocess.run(["vcgencmd", *args], capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return out.strip().split("=", 1)[-1] if "=" in out else None
+
+
+def read_head(stream):
+    " Reads just enough of the dump to cover the ELF notes "
+    head = b""
+    need = 4096
+    while len(head) < need:
+        chunk = stream.read(min(CHUNK, need - len(head)))
+        if not chunk:
+            break
+        head += chunk
+        end = _notes_end(head)
+        if end is not None:
+            need = min(end, MAX_HEAD)
+        elif len(head) >= 4096:
+            break # not an ELF core, or the phdrs are somewhere silly
+    return head
+
+
+def ingest(stream, store, exe, board=None, voltage=None, crash_time=None,
+           signal=None, keep=1):
+    """ Streams a dump into the store: returns (signature, entry, kept)
+    Dumps of a signature we already have enough samples of are just counted,
+    and never hit the disk """
+    head = read_head(stream)
+    info = parse_core(head) or {}
+    if info.get("signal") is None:
+        info["signal"] = signal
+    sig = signature(exe, info)
+    crash = dict(info, exe=exe, board=board or socket.gethostname(),
+                 voltage=voltage, time=crash_time or int(time.time()))
+
+    with Index(store) as index:
+        want = index.wants_sample(sig, keep)
+
+    sha, size, tmp = hashlib.sha256(head), len(head), None
+    if want:
+        fd, tmp = tempfile.mkstemp(dir=os.path.join(store, "objects"), suffix=".tmp")
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=3) as gz:
+            gz.write(head)
+            while chunk := stream.read(CHUNK):
+                sha.update(chunk)
+                size += len(chunk)
+                gz.write(chunk)
+    else:
+        # Still drain it, the kernel waits on us
+        while chunk := stream.read(CHUNK):
+            sha.update(chunk)
+            size += len(chunk)
+
+    with Index(store) as index:
+        entry = index.record(sig, crash)
+        kept = False
+        if tmp is not None:
+            name = f"objects/{sha.hexdigest()}.core.gz"
+            # Someone else may have filled the slot while we were streaming
+            if name not in entry["samples"] and len(entry["samples"]) < keep:
+                os.chmod(tmp, 0o644) # we run as root, the host pulls as baking
+                os.replace(tmp, os.path.join(store, name))
+                entry["samples"].append(name)
+                entry.setdefault("sizes", {})[name] = size
+                kept = True
+            else:
+                os.unlink(tmp)
+    return sig, entry, kept
+
+
+def merge(sources, store, keep=1):
+    """ Folds other stores (e.g. pulled from each pi) into this one
+    Safe to repeat: each store's counts replace what we had from it last time """
+    with Index(store) as index:
+        for src in sources:
+            with open(os.path.join(src, "index.json")) as f:
+                data = json.load(f)
+            # Stores from before store ids: the path is the best id we've got
+            src_id = data.get("store_id") or os.path.abspath(src)
+            for sig, theirs in data["signatures"].items():
+                ours = index.sigs.setdefault(sig, dict(theirs, samples=[], sizes={}, sources={}))
+                mine = index.sources(ours)
+                # Per-store counts all the way down, so merging a fleet store
+                # that already has this pi in it doesn't count it twice either
+                for sid, part in index.sources(theirs, src_id).items():
+                    if sid != index.id:
+                        mine[sid] = part
+                totals(ours)
+                if not ours.get("backtrace") and theirs.get("backtrace"):
+                    ours["backtrace"] = theirs["backtrace"]
+                for name in theirs["samples"]:
+                    # Content addressed: the same dump has the same name everywhere
+                    if name in ours["samples"] or len(ours["samples"]) >= keep:
+                        continue
+                    if not os.path.exists(os.path.join(src, name)):
+                        continue
+                    dest = os.path.join(store, name)
+                    if not os.path.exists(dest):
+                        shutil.copy2(os.path.join(src, name), dest)
+                    ours["samples"].append(name)
+                    ours.setdefault("sizes", {})[name] = theirs.get("sizes", {}).get(name)
+    return index
+
+
+def triage(store, exe_dir=None):
+    """ Runs gdb bt on one sample of each signature that doesn't have a backtrace yet
+    gdb needs the binary at the same path (or in exe_dir) """
+    if shutil.which("gdb") is None:
+        print("gdb not found, can't triage")
+        return
+    with Index(store) as index:
+        for sig, entry in index.sigs.items():
+            if entry.get("backtrace") or not entry["samples"]:
+                continue
+            exe = entry.get("exe_path") or entry["exe"]
+            if exe_dir:
+                exe = os.path.join(exe_dir, os.path.basename(exe))
+            with tempfile.NamedTemporaryFile(suffix=".core") as core:
+                with gzip.open(os.path.join(store, entry["samples"][0]), "rb") as gz:
+                    shutil.copyfileobj(gz, core, CHUNK)
+                core.flush()
+                proc = subprocess.run(["gdb", "-batch", "-nx", "-ex", "bt", exe, core.name],
+                                      capture_output=True, text=True)
+            bt = [line for line in proc.stdout.splitlines() if line.startswith("#")]
+            entry["backtrace"] = bt
+            print(f"{sig} {entry['exe']}: {len(bt)} frames")
+
+
+def format_index(index):
+    lines = [f"{'signature':>16} {'count':>6} {'exe':>14} {'sig':>4} {'pc':>28} {'boards':>6}  voltages"]
+    for sig, e in sorted(index.sigs.items(), key=lambda kv: -kv[1]["count"]):
+        volts = ",".join(f"{v}x{n}" for v, n in sorted(e["voltages"].items()))
+        lines.append(f"{sig:>16} {e['count']:>6} {e['exe'][:14]:>14} {str(e['signal']):>4}"
+                     f" {str(e['pc'])[:28]:>28} {len(e['boards']):>6}  {volts}")
+    return "\n".join(lines)
+
+
+# ==================== MAIN
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="dump_store.py",
+                description="Compressed, deduplicated core dump store")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--keep", type=int, default=1, help="samples to keep per signature")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_ingest = sub.add_parser("ingest", help="add dumps (from stdin when used as core_pattern)")
+    p_ingest.add_argument("paths", nargs="*", help="raw core files (default: stdin)")
+    p_ingest.add_argument("--exe", help="executable name (core_pattern %%e)")
+    p_ingest.add_argument("--time", type=int, help="core_pattern %%t")
+    p_ingest.add_argument("--signal", type=int, help="core_pattern %%s")
+    p_ingest.add_argument("--board", help="default: hostname")
+    p_ingest.add_argument("--voltage", help="default: vcgencmd get_config over_voltage")
+    p_ingest.add_argument("--delete", action="store_true", help="remove raw files once they're in")
+
+    sub.add_parser("list", help="print the index, most common crash first")
+
+    p_merge = sub.add_parser("merge", help="fold other stores into --store")
+    p_merge.add_argument("sources", nargs="+")
+
+    p_triage = sub.add_parser("triage", help="gdb backtrace for each new signature")
+    p_triage.add_argument("--exe-dir", help="where to find the binaries, if not at their pi paths")
+
+    args = parser.parse_args()
+
+    if args.cmd == "ingest":
+        voltage = args.voltage or vcgencmd("get_config", "over_voltage")
+        if not args.paths:
+            sig, entry, kept = ingest(sys.stdin.buffer, args.store, args.exe or "unknown",
+                                      args.board, voltage, args.time, args.signal, args.keep)
+            print(f"{sig} count={entry['count']} kept={kept}")
+        for path in args.paths:
+            # core.%e.%p.%t
+            parts = os.path.basename(path).split(".")
+            exe = args.exe or (".".join(parts[1:-2]) if len(parts) >= 4 else "unknown")
+            crash_time = args.time or (int(parts[-1]) if parts[-1].isdigit() else int(os.path.getmtime(path)))
+            with open(path, "rb") as f:
+                sig, entry, kept = ingest(f, args.store, exe, args.board, voltage,
+                                          crash_time, args.signal, args.keep)
+            print(f"{path}: {sig} count={entry['count']} kept={kept}")
+            if args.delete:
+                os.unlink(path)
+    elif args.cmd == "list":
+        with Index(args.store) as index:
+            print(format_index(index))
+    elif args.cmd == "merge":
+        print(format_index(merge(args.sources, args.store, args.keep)))
+    else:
+        triage(args.store, args.exe_dir)
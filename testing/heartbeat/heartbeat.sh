@@ -1,7 +1,9 @@
-#!/bin/sh
+#!/bin/bash
 
 # Set log file path
 LOGFILE="$HOME/temperature_log.csv"
+# "<collector host> <port>" for experiments/fleet_collector.py (optional)
+COLLECTOR_CONF="$HOME/eb_collector.conf"
 
 TIMESTAMP=$(date +"%Y-%m-%d %H:%M:%S")
 
@@ -11,3 +13,10 @@ FREQUENCY_CORE=$(vcgencmd measure_clock core)
 FREQUENCY_ARM=$(vcgencmd measure_clock arm)
 
 echo "$TIMESTAMP,$TEMP,$VOLTAGE,$FREQUENCY_CORE,$FREQUENCY_ARM" >> "$LOGFILE"
+
+# Push the same sample to the fleet collector, so nobody has to ssh in for it
+if [ -f "$COLLECTOR_CONF" ]; then
+    read -r CHOST CPORT < "$COLLECTOR_CONF"
+    echo "EB1,$(hostname),$(date +%s),$TEMP,$VOLTAGE,$FREQUENCY_CORE,$FREQUENCY_ARM" \
+        > "/dev/udp/$CHOST/${CPORT:-5140}" 2>/dev/null
+fi
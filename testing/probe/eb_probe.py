@@ -2,15 +2,27 @@
 
 import sys
 import os
+import socket
 import subprocess
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "..", "ser-automation", "tgt_scripts"))
+import tryboot_render
+import result_cache
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "..", "experiments"))
+import sweep_scheduler
+
 # MUST BE RUN AS ROOT
 #
 # uvolt.status contains either the most recent undervolting amount, in steps (small positive val)
 # OR if its time to restart, it contains -1
 #
 WORKING_DIR="/home/baking/easy_bake/testing/probe"
+# What run_stress.sh runs, for the result cache key
+STRESS_METHOD="fft"
+STRESS_DURATION="10m"
 def get_most_recent_log(directory_path=f'{WORKING_DIR}/logs'):
     entries = os.listdir(directory_path)
     entries_with_times = []
@@ -65,34 +77,149 @@ def restart_uvolt():
     set_uvolt_status(-1)
     mark_undervolting_done()
     
+def next_scheduled_step():
+    """If sched.conf ("<host> <port>") exists, report how the last step went to
+    experiments/sweep_scheduler.py and get the next step from it.
+    Returns None if there's no scheduler (or it's unreachable / out of work)"""
+    try:
+        with open(f"{WORKING_DIR}/sched.conf", 'r') as f:
+            host, port = f.read().split()[:2]
+    except (FileNotFoundError, ValueError):
+        return None
+
+    item_id = passed = None
+    try:
+        with open(f"{WORKING_DIR}/sched.item", 'r') as f:
+            item_id = int(f.read().strip())
+        passed = not last_log_failed()
+    except (FileNotFoundError, ValueError, IndexError):
+        pass
+
+    try:
+        item = sweep_scheduler.nextItem(host, int(port), socket.gethostname(), item_id, passed)
+    except (OSError, ValueError) as e:
+        print(f"Scheduler unreachable ({e}), falling back to the ladder")
+        return None
+    if item is None:
+        return None
+    with open(f"{WORKING_DIR}/sched.item", 'w+') as f:
+        f.write(str(item["id"]))
+    return item["vars"]["STEP"]
+
+def firmware_tag():
+    """Firmware build hash from vcgencmd version, so a firmware update invalidates cached results"""
+    try:
+        out = subprocess.run(['vcgencmd', 'version'], capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    for line in out.splitlines():
+        if line.startswith("version "):
+            return line.split()[1]
+    return None
+
+def step_hash(undervolt_step):
+    """Hash of the tryboot.txt we'd write for this step (the result cache key)"""
+    content = tryboot_render.renderFile(f"{WORKING_DIR}/tryboot_template.txt", {"VOLTAGE": undervolt_step})
+    return tryboot_render.contentHash(content)
+
+def get_cache():
+    return result_cache.ResultCache(f"{WORKING_DIR}/{result_cache.CACHE_NAME}", firmware_tag())
+
+def record_last_step(cache, last_uvolt):
+    """Put the most recent stress log's result in the cache, against the step we were on (once per log)"""
+    if last_uvolt < 0:
+        return
+    try:
+        logfile = get_most_recent_log()
+    except (FileNotFoundError, IndexError):
+        return
+    if any(r.get("log") == logfile for r in cache.records):
+        return
+    passed = last_log_outcome()
+    if passed is None:
+        print(f"{logfile} didn't finish (reboot cut it short?), not caching it")
+        return
+    cache.record(socket.gethostname(), step_hash(last_uvolt), STRESS_METHOD, STRESS_DURATION,
+                 passed, step=last_uvolt, log=logfile)
+
+def skip_established(cache, uvolt):
+    """Walks the ladder past steps we already know pass on this board.
+    Returns the step to test, or None if we hit a step we already know fails
+    (touch no_cache in WORKING_DIR to test everything anyway)"""
+    if os.path.exists(f"{WORKING_DIR}/no_cache"):
+        return uvolt
+    board = socket.gethostname()
+    while True:
+        verdict = cache.verdict(board, step_hash(uvolt), STRESS_METHOD, STRESS_DURATION)
+        if verdict is None:
+            return uvolt
+        if verdict is False:
+            print(f"Step {uvolt} is known to fail on {board}, ladder done")
+            return None
+        print(f"Step {uvolt} is known to pass on {board}, skipping it")
+        uvolt += 1
+
 def iterate_undervolt():
+    """Picks the next step, writes tryboot.txt and reboots into it.
+    Returns False if there's nothing left worth testing"""
     # stop the stress service (it will automatically restart after boot)
     subprocess.Popen(['systemctl','stop','eb_stress'])
     last_uvolt=get_uvolt_status()
+    cache=get_cache()
+    record_last_step(cache, last_uvolt)
     uvolt=0
-    if last_uvolt==-1:
-        uvolt=0
+    scheduled=next_scheduled_step()
+    if scheduled is not None:
+        uvolt=scheduled
     else:
-        uvolt=last_uvolt+1
+        if last_uvolt==-1:
+            uvolt=0
+        else:
+            uvolt=last_uvolt+1
+        uvolt=skip_established(cache, uvolt)
+        if uvolt is None:
+            restart_uvolt()
+            return False
     write_tryboot(uvolt)
     set_uvolt_status(uvolt)
     process = subprocess.Popen(['reboot', '\'0 tryboot\''], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return True
 
 def run_experiment():
     """Run the stress experiment"""
     subprocess.Popen([f"{WORKING_DIR}/run_stress.sh", "fft"])
 
-def check_stress_output():
-    """check the output of the stress experiment"""
+def last_log_failed():
+    """True if the most recent stress log has a failure in it"""
     logfile=get_most_recent_log()
-    print(logfile)
-    with open(logfile, 'r') as file:
+    with open(f"{WORKING_DIR}/logs/{logfile}", 'r') as file:
         for line in file:
             if "stress-ng: fail:" in line:
-                write_macro_log(logfile)
                 return True
     return False
 
+def last_log_outcome():
+    """True if the most recent stress log ran to completion cleanly, False if it
+    has a failure in it, None if it stopped early (e.g. killed by a reboot)"""
+    logfile=get_most_recent_log()
+    finished=False
+    with open(f"{WORKING_DIR}/logs/{logfile}", 'r') as file:
+        for line in file:
+            if "stress-ng: fail:" in line:
+                return False
+            if "successful run completed" in line or "passed:" in line:
+                finished=True
+    return True if finished else None
+
+def check_stress_output():
+    """check the output of the stress experiment"""
+    logfile=get_most_recent_log()
+    print(logfile)
+    if last_log_failed():
+        write_macro_log(logfile)
+        return True
+    return False
+
 #"2025-05-31T09:45:24Z_volt=1.1938V_zeta_10_eb_probe.log"
 def write_macro_log(filename):
     err_log=f"{WORKING_DIR}/logs/errors.log"
@@ -105,14 +232,11 @@ def write_macro_log(filename):
     
 def write_tryboot(undervolt_step):
     template=f"{WORKING_DIR}/tryboot_template.txt"
-    output="/boot/firmware/tryboot.txt"
-    placeholder="<voltage>"
     try:
-        with open(template, 'r') as f_in:
-            content = f_in.read()
-        updated_content = content.replace(placeholder, str(undervolt_step))
-        with open(output, 'w') as f_out:
-            f_out.write(updated_content)
+        content = tryboot_render.renderFile(template, {"VOLTAGE": undervolt_step})
+        changed, _ = tryboot_render.install(content)
+        if not changed:
+            print(f"tryboot.txt already set for step {undervolt_step}, skipped write")
 
     except FileNotFoundError:
         print(f"Error: Template file not found at '{template}'")
@@ -124,7 +248,8 @@ def main():
     if check_undervolting_done():
         sys.exit()
     
-    iterate_undervolt()
+    if not iterate_undervolt():
+        sys.exit()
     run_experiment()
     err=check_stress_output()
     if err: